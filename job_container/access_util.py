@@ -1,8 +1,88 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import decimal
+import logging
 import subprocess
-from io import BytesIO
+import tempfile
+import re
+from io import BytesIO, TextIOWrapper
 import csv
-from typing import List, Dict
+from typing import List, Dict, Iterator, Tuple, Optional
+import os
+import threading
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Format mdb-export is asked to use for date/time values in typed mode, so they parse
+# unambiguously regardless of the container locale.
+EXPORT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Access column types (as reported by mdb-schema) and the kind of column they are
+# converted to in typed mode.  Anything not listed stays a string.
+ACCESS_COLUMN_KINDS = {
+    "Byte": "int",
+    "Integer": "int",
+    "Long Integer": "int",
+    "Single": "float",
+    "Double": "float",
+    "Currency": "decimal",
+    "Numeric": "decimal",
+    "Decimal": "decimal",
+    "DateTime": "datetime",
+    "Date/Time": "datetime",
+    "Boolean": "bool",
+    "Yes/No": "bool",
+}
+
+_SCHEMA_COLUMN = re.compile(r"^\s*\[(?P<name>[^\]]+)\]\s+(?P<type>[^,(]+?)\s*(?P<size>\(.*?\))?\s*(NOT NULL)?\s*,?\s*$")
+# Scale of a "(precision, scale)" size, and of the decimal types reported without one.
+# Access Currency always has 4 decimal places; Numeric defaults to (18, 0).
+_DECIMAL_SIZE = re.compile(r"\(\s*\d+\s*,\s*(?P<scale>\d+)\s*\)$")
+_DECIMAL_SCALES = {"Currency": 4}
+_DECIMAL_CONTEXT = decimal.Context(prec=38)
+_BOOLEAN_VALUES = {"1": True, "0": False, "TRUE": True, "FALSE": False, "True": True, "False": False}
+
+
+class ExportProcesses:
+    """
+    The mdb-export processes started for one file, so that they can all be killed
+    when the extraction is abandoned part way (see export_table_to_csv).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = set()
+        self.killed = False
+
+    def start(self, command: List[str], **kwargs) -> subprocess.Popen:
+        """
+        Starts command like subprocess.Popen, unless kill_all was called.
+
+        Raises:
+            RuntimeError: If the processes were already killed.
+        """
+        with self.lock:
+            if self.killed:
+                raise RuntimeError("Export cancelled")
+            process = subprocess.Popen(command, **kwargs)
+            self.running.add(process)
+            return process
+
+    def finished(self, process: subprocess.Popen) -> None:
+        with self.lock:
+            self.running.discard(process)
+
+    def kill_all(self) -> None:
+        """
+        Kills the running processes and refuses to start new ones.
+        """
+        with self.lock:
+            self.killed = True
+            for process in self.running:
+                process.kill()
+
 
 class MSAccessUtils:
     def __init__(self):
@@ -26,8 +106,9 @@ class MSAccessUtils:
                 print("Warning: mdbtools does not support passwords.  The password will be ignored.")
 
             # Get a list of table names
-            process = subprocess.Popen(['mdb-tables', '-1', file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
+            with metrics.phase("mdb-tables"):
+                process = subprocess.Popen(['mdb-tables', '-1', file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                stdout, stderr = process.communicate()
             if stderr:
                 return {"error": f"Error listing tables: {stderr.decode()}"}  # Return a dictionary with an error key
             table_names = stdout.decode().strip().split('\n')
@@ -37,9 +118,174 @@ class MSAccessUtils:
             return {"error": f"An unexpected error occurred: {e}"}  # Return a dictionary with an error key
 
 
+    def iter_table_rows(file_path: str, table_name: str) -> Iterator[Dict[str, str]]:
+        """
+        Streams the rows of a table in an MS Access database file straight from the
+        mdb-export pipe, one row at a time.  Only the current row is held in memory,
+        so the table size does not affect the memory footprint of the caller.
+
+        Args:
+            file_path (str): Path to the MS Access file.
+            table_name (str): Name of the table to read.
+
+        Yields:
+            Dict[str, str]: A dictionary per row.  The keys are column names and the
+                            values are the corresponding row values (as strings).
+
+        Raises:
+            RuntimeError: If mdb-export reports an error once the export has finished.
+        """
+        header = None
+        for record in _stream_export(file_path, table_name):
+            if header is None:
+                header = record
+                continue
+            yield dict(zip(header, record))
+
+    def read_table_batches(file_path: str, table_name: str, batch_size: int = 10000) -> Iterator[List[Dict[str, str]]]:
+        """
+        Streams the rows of a table in an MS Access database file as fixed-size batches.
+        Peak memory depends on batch_size rather than on the size of the table.
+
+        Args:
+            file_path (str): Path to the MS Access file.
+            table_name (str): Name of the table to read.
+            batch_size (int, optional): Maximum number of rows per batch. Defaults to 10000.
+
+        Yields:
+            List[Dict[str, str]]: Lists of at most batch_size rows, in table order.
+
+        Raises:
+            RuntimeError: If mdb-export reports an error.
+        """
+        return _batched(MSAccessUtils.iter_table_rows(file_path, table_name), batch_size)
+
+    def read_table_schema(file_path: str, table_name: str) -> List[Tuple[str, str]]:
+        """
+        Reads the column names and Access column types of a table with mdb-schema.
+
+        Args:
+            file_path (str): Path to the MS Access file.
+            table_name (str): Name of the table.
+
+        Returns:
+            List[Tuple[str, str]]: (column name, Access type) pairs in column order, e.g.
+                ("ID", "Long Integer").  Sizes such as the "(50)" of "Text (50)" are dropped,
+                except the (precision, scale) of decimal types, e.g. "Numeric (18, 4)".
+
+        Raises:
+            RuntimeError: If mdb-schema reports an error.
+        """
+        process = subprocess.Popen(['mdb-schema', '-T', table_name, file_path, 'access'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"Error reading table schema: {stderr.decode(errors='replace')}")
+        columns = []
+        for line in stdout.decode().splitlines():
+            match = _SCHEMA_COLUMN.match(line)
+            if match:
+                access_type = match.group("type").strip()
+                if ACCESS_COLUMN_KINDS.get(access_type) == "decimal" and match.group("size"):
+                    access_type = f"{access_type} {match.group('size')}"
+                columns.append((match.group("name"), access_type))
+        return columns
+
+    def read_table_frames(file_path: str, table_name: str, batch_size: int = 10000,
+                          schema: Optional[List[Tuple[str, str]]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Streams a table of an MS Access database file as typed, columnar batches.  Column
+        types come from mdb-schema: integers, floats, timestamps and booleans become
+        NumPy-backed (nullable) pandas columns, Currency, Numeric and Decimal become exact
+        Arrow decimal columns and everything else stays a string.
+
+        Args:
+            file_path (str): Path to the MS Access file.
+            table_name (str): Name of the table to read.
+            batch_size (int, optional): Maximum number of rows per batch. Defaults to 10000.
+            schema (list, optional): The table schema from read_table_schema.  Read from
+                the file when not given.
+
+        Yields:
+            pd.DataFrame: Batches of at most batch_size rows, in table order.
+
+        Raises:
+            RuntimeError: If mdb-schema or mdb-export reports an error.
+        """
+        if schema is None:
+            schema = MSAccessUtils.read_table_schema(file_path, table_name)
+        return _typed_frames(_stream_export(file_path, table_name, typed=True), batch_size, dict(schema))
+
+    def export_table_to_csv(file_path: str, table_name: str, csv_path: str, typed: bool = False,
+                            processes: Optional[ExportProcesses] = None) -> str:
+        """
+        Exports a table of an MS Access database file to a CSV file on local disk.  The
+        output of mdb-export is written straight to the file, so no table data passes
+        through Python memory.
+
+        Args:
+            file_path (str): Path to the MS Access file.
+            table_name (str): Name of the table to export.
+            csv_path (str): Path of the CSV file to write.
+            typed (bool, optional): Export dates in the format read_csv_frames expects.
+            processes (ExportProcesses, optional): Registers the mdb-export process so
+                that it can be killed with the other exports of the file.
+
+        Returns:
+            str: csv_path, for convenience when used as a worker task.
+
+        Raises:
+            RuntimeError: If mdb-export reports an error or was killed.
+        """
+        command = _export_command(file_path, table_name, typed)
+        with metrics.phase("mdb-export", table_name) as counts, open(csv_path, 'wb') as csv_file:
+            if processes is None:
+                process = subprocess.Popen(command, stdout=csv_file, stderr=subprocess.PIPE)
+            else:
+                process = processes.start(command, stdout=csv_file, stderr=subprocess.PIPE)
+            try:
+                _, stderr = process.communicate()
+            finally:
+                if processes is not None:
+                    processes.finished(process)
+            counts["bytes"] = os.path.getsize(csv_path)
+        if stderr or process.returncode != 0:
+            raise RuntimeError(f"Error exporting table data: {stderr.decode(errors='replace')}")
+        return csv_path
+
+    def read_csv_batches(csv_path: str, batch_size: int = 10000) -> Iterator[List[Dict[str, str]]]:
+        """
+        Streams a CSV file written by export_table_to_csv as fixed-size row batches.
+
+        Args:
+            csv_path (str): Path of the exported CSV file.
+            batch_size (int, optional): Maximum number of rows per batch. Defaults to 10000.
+
+        Yields:
+            List[Dict[str, str]]: Lists of at most batch_size rows, in table order.
+        """
+        with open(csv_path, 'r', encoding='utf-8', newline='') as csv_file:
+            yield from _batched(csv.DictReader(csv_file), batch_size)
+
+    def read_csv_frames(csv_path: str, schema: List[Tuple[str, str]], batch_size: int = 10000) -> Iterator[pd.DataFrame]:
+        """
+        Streams a CSV file written by export_table_to_csv(typed=True) as typed batches,
+        like read_table_frames.
+
+        Args:
+            csv_path (str): Path of the exported CSV file.
+            schema (list): The table schema from read_table_schema.
+            batch_size (int, optional): Maximum number of rows per batch. Defaults to 10000.
+
+        Yields:
+            pd.DataFrame: Batches of at most batch_size rows, in table order.
+        """
+        with open(csv_path, 'r', encoding='utf-8', newline='') as csv_file:
+            yield from _typed_frames(csv.reader(csv_file), batch_size, dict(schema))
+
     def read_table_data(file_path: str, table_name: str) -> List[Dict[str, str]]:
         """
         Reads data from a specified table in an MS Access database file.
+        Prefer read_table_batches for large tables; this buffers the whole table.
 
         Args:
             file_path (str): Path to the MS Access file.
@@ -53,17 +299,148 @@ class MSAccessUtils:
                                 if there's an error.
         """
         try:
-            process = subprocess.Popen(['mdb-export', file_path, table_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-
-            if stderr:
-                print(f"Error exporting table data: {stderr.decode()}")
-                return []
-
-            csv_data = stdout.decode()
-            reader = csv.DictReader(csv_data.splitlines())
-            return list(reader)
+            return list(MSAccessUtils.iter_table_rows(file_path, table_name))
 
+        except RuntimeError as e:
+            print(e)
+            return []
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
             return []
+
+
+def _batched(rows: Iterator[Dict[str, str]], batch_size: int) -> Iterator[List[Dict[str, str]]]:
+    """
+    Groups an iterator of rows into lists of at most batch_size rows.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1.")
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _export_command(file_path: str, table_name: str, typed: bool = False) -> List[str]:
+    """
+    Builds the mdb-export command line for a table.
+    """
+    if typed:
+        return ['mdb-export', '-D', EXPORT_DATE_FORMAT, file_path, table_name]
+    return ['mdb-export', file_path, table_name]
+
+
+def _stream_export(file_path: str, table_name: str, typed: bool = False) -> Iterator[List[str]]:
+    """
+    Streams the CSV records (header first) of a table straight from the mdb-export pipe.
+    Raises RuntimeError if mdb-export reports an error once the export has finished.
+    """
+    # stderr goes to a temporary file so a chatty mdb-export can never block on a
+    # full stderr pipe while we are still consuming stdout.
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(_export_command(file_path, table_name, typed), stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            yield from csv.reader(TextIOWrapper(process.stdout, encoding='utf-8', newline=''))
+            process.wait()
+        finally:
+            # The consumer may stop early; never leave mdb-export running behind us.
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+        if stderr or process.returncode != 0:
+            raise RuntimeError(f"Error exporting table data: {stderr.decode(errors='replace')}")
+
+
+def _typed_frames(records: Iterator[List[str]], batch_size: int, column_types: Dict[str, str]) -> Iterator[pd.DataFrame]:
+    """
+    Groups CSV records (header first) into typed DataFrames of at most batch_size rows.
+    """
+    header = next(records, None)
+    if header is None:
+        return
+    for batch in _batched(records, batch_size):
+        columns = zip(*batch)
+        yield pd.DataFrame({name: _typed_column(name, values, column_types.get(name))
+                            for name, values in zip(header, columns)})
+
+
+def _typed_column(name: str, values: Tuple[str, ...], access_type: Optional[str]) -> pd.Series:
+    """
+    Converts the string values of one column to the pandas type matching its Access type.
+    mdb-export writes NULL as an empty field, which becomes a missing value.  Values that
+    cannot be converted also become missing values, and are reported with a warning.
+    """
+    base_type = (access_type or "").split(" (")[0]
+    kind = ACCESS_COLUMN_KINDS.get(base_type)
+    column = pd.Series(values, dtype=object)
+    if kind is None:
+        return column
+    column = column.where(column != "", None)
+    if kind == "int":
+        numbers = pd.to_numeric(column, errors="coerce")
+        # A fractional or out of range value would make the cast raise for the whole table
+        typed = numbers.where((numbers % 1 == 0) & (numbers.abs() < 2 ** 63)).astype("Int64")
+    elif kind == "float":
+        typed = pd.to_numeric(column, errors="coerce").astype("float64")
+    elif kind == "decimal":
+        typed = _decimal_column(column, _decimal_scale(access_type))
+    elif kind == "datetime":
+        typed = _datetime_column(column)
+    else:
+        typed = column.map(_BOOLEAN_VALUES).astype("boolean")
+    coerced = column.notna().to_numpy() & typed.isna().to_numpy()
+    if coerced.any():
+        logger.warning(f"{int(coerced.sum())} values of column '{name}' are not valid {access_type} values "
+                       f"and were loaded as NULL, e.g. {column[coerced].iloc[0]!r}")
+    return typed
+
+
+def _decimal_scale(access_type: str) -> int:
+    """
+    The number of decimal places of an Access decimal type such as "Numeric (18, 4)".
+    """
+    match = _DECIMAL_SIZE.search(access_type)
+    return int(match.group("scale")) if match else _DECIMAL_SCALES.get(access_type, 0)
+
+
+def _decimal_column(column: pd.Series, scale: int) -> pd.Series:
+    """
+    Converts decimal strings to an Arrow decimal128(38, scale) column, so Currency and
+    Numeric values keep every digit instead of being rounded to the nearest float.
+    """
+    exponent = decimal.Decimal(1).scaleb(-scale)
+    values = []
+    for value in column:
+        try:
+            number = decimal.Decimal(value).quantize(exponent, context=_DECIMAL_CONTEXT) if value is not None else None
+        except decimal.InvalidOperation:
+            number = None
+        values.append(number if number is None or number.is_finite() else None)
+    return pd.Series(pd.array(values, dtype=pd.ArrowDtype(pa.decimal128(38, scale))))
+
+
+def _datetime_column(column: pd.Series) -> pd.Series:
+    """
+    Converts EXPORT_DATE_FORMAT strings to a datetime64[s] column.  Access dates run from
+    the year 100 to 9999, well past the 2262 limit of pandas' default nanoseconds, and
+    sentinels such as 9999-12-31 are common; the export has no fractional seconds.
+    """
+    try:
+        return pd.Series(column.to_numpy().astype("datetime64[s]"))
+    except ValueError:
+        # Parse one value at a time so a single bad value does not null the batch
+        return pd.Series(np.array([_to_datetime64(value) for value in column], dtype="datetime64[s]"))
+
+
+def _to_datetime64(value: Optional[str]) -> Optional[np.datetime64]:
+    try:
+        return np.datetime64(value, "s") if value is not None else None
+    except ValueError:
+        return None
@@ -4,7 +4,11 @@ import logging
 import json
 import toml  # Import the toml library
 from snowflake.snowpark import Session
-import utils
+import scheduler
+import service
+from processed_index import create_index
+from session_pool import create_session_pool
+from local_session import create_local_session
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
@@ -54,6 +58,9 @@ def connect_snowflake(toml_file_path: str) -> Session:
     except toml.TomlDecodeError as e:
         raise toml.TomlDecodeError(f"Error decoding TOML file: {e}")
     snowflake_config = config.get('snowflake', {})  #handles if there is no snowflake section
+    if snowflake_config.get("connection") == "local":
+        # Offline stand-in: stages are directories and tables live in SQLite
+        return create_local_session(snowflake_config)
     
     if os.path.exists("/snowflake/session/token"):
         logger.info("Creating a session as service user.")
@@ -63,7 +70,7 @@ def connect_snowflake(toml_file_path: str) -> Session:
             'protocol': "https",
             'account': os.getenv('SNOWFLAKE_ACCOUNT'),
             'authenticator': "oauth",
-            'token': open('/snowflake/session/token', 'r').read(),
+            'token': get_login_token(),
             'warehouse': os.getenv('SNOWFLAKE_WAREHOUSE'),
             'database': os.getenv('SNOWFLAKE_DATABASE'),
             'schema': os.getenv('SNOWFLAKE_SCHEMA'),
@@ -116,32 +123,34 @@ def main():
         logger.error("Failed to establish a database connection. Exiting.")
         return  # Exit if connection fails
 
-    raw_stage = config[env]["raw_stage"]
-    processing_stage = config[env]["processing_stage"]
-    complete_stage = config[env]["complete_stage"]
-    error_stage = config[env]["error_stage"]
+    stages = {
+        "raw": config[env]["raw_stage"],
+        "processing": config[env]["processing_stage"],
+        "complete": config[env]["complete_stage"],
+        "error": config[env]["error_stage"],
+    }
     
     #For Testing sample data 
     #table_data={"customers": [{"customer_id": "1", "name": "Dave Lister"}, {"customer_id": "2", "name": "Arnold Rimmer"}, {"customer_id": "3", "name": "The Cat"}, {"customer_id": "4", "name": "Holly"}, {"customer_id": "5", "name": "Kryten"}, {"customer_id": "6", "name": "Kristine Kochanski"}], "orders": [{"order_id": "1", "customer_id": "2", "product_id": "1", "amount": "7"}, {"order_id": "2", "customer_id": "2", "product_id": "3", "amount": "2"}, {"order_id": "3", "customer_id": "1", "product_id": "2", "amount": "3"}, {"order_id": "4", "customer_id": "6", "product_id": "3", "amount": "5"}], "products": [{"product_id": "1", "title": "Chair"}, {"product_id": "2", "title": "Table"}, {"product_id": "3", "title": "Computer"}]}    
-    #utils.write_json_string_to_table(session, json.dumps(table_data), "test")
+    #utils.write_table_data(session, table_data, "test")
     
-    #1.  Extract stage names from the configuration
-    files_list=utils.list_files_in_stage(session, raw_stage)
-    #2.  Move the file and process them sequentially
-    if files_list:
-        if len(files_list)==0:
-            logger.info("No files to process")
-            return
-        #Iterate through each of the files
-        for f in files_list:
-            filename=f["name"].split("/")[-1]
-            utils.move_staged_file(session, filename, raw_stage,processing_stage)
-            results=utils.process_file(session,filename, processing_stage)
-            if results:
-                utils.move_staged_file(session, filename, processing_stage,complete_stage)
-            else:
-                utils.move_staged_file(session, filename, processing_stage,error_stage)
-
+    if config[env].get("run_mode", "job") == "service":
+        #Keep running, polling the raw stage, until the service is stopped
+        service.run_service(lambda: connect_snowflake(config_file), stages, config[env], session)
+        return
+    #1.  List the raw stage, 2.  move the files and process them, file_workers at a time
+    #File workers get a session each from the pool if session_pool_size is set
+    pool=create_session_pool(lambda: connect_snowflake(config_file), config[env])
+    try:
+        summary=scheduler.process_raw_stage(session, stages, config[env], create_index(session, config[env]), pool)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return
+    finally:
+        if pool is not None:
+            pool.close()
+    if summary is None:
+        logger.info("No files to process")
 
 if __name__ == "__main__":
     main()
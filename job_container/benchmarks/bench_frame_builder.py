@@ -0,0 +1,67 @@
+"""
+Micro-benchmark for building the load frame of a database with many tables: the
+original repeated pd.concat per table against loaders.build_load_frame.
+
+Usage (from the job_container directory):
+    python benchmarks/bench_frame_builder.py --tables 100 300 1000 --rows 200
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from loaders import build_load_frame
+
+
+def concat_load_frame(table_data, filename, now):
+    """
+    The frame builder write_json_string_to_table used before: one pd.concat per table.
+    """
+    df=pd.DataFrame(columns=['table_name', 'row', "filename", "timestamp"])
+    for tablename in table_data.keys():
+        tmpdf=pd.DataFrame({'table_name': tablename, 'row':table_data[tablename], "filename":filename, "timestamp":now})
+        df=pd.concat([df, tmpdf], ignore_index=True)
+    return df
+
+
+def make_tables(tables: int, rows: int, columns: int = 8):
+    """
+    Builds synthetic table data: tables tables of rows rows with string values.
+    """
+    return {f"table_{t}": [{f"col_{c}": f"value {r} {c}" for c in range(columns)} for r in range(rows)]
+            for t in range(tables)}
+
+
+def best_of(repeat, func, *args):
+    """
+    Returns the fastest of repeat timed calls, in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 300, 1000])
+    parser.add_argument("--rows", type=int, default=200, help="rows per table")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    now = datetime.datetime.now()
+    print(f"{'tables':>8} {'rows':>10} {'concat s':>10} {'builder s':>10} {'speedup':>8}")
+    for tables in args.tables:
+        table_data = make_tables(tables, args.rows)
+        concat_time = best_of(args.repeat, concat_load_frame, table_data, "bench.mdb", now)
+        builder_time = best_of(args.repeat, build_load_frame, table_data.items(), "bench.mdb", now)
+        print(f"{tables:>8} {tables * args.rows:>10} {concat_time:>10.3f} {builder_time:>10.3f} {concat_time / builder_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+End-to-end ingestion benchmark: runs utils.process_file over Access databases of
+several shapes and records rows/s, MB/s and peak RSS per case.
+
+By default the databases are synthetic (see synthetic_mdbtools.py): many small
+tables, one huge table, wide tables and memo-heavy tables, scaled by --scale.  With
+--fixtures the .mdb/.accdb files in that directory are used instead, with the real
+mdbtools.  Snowflake is replaced by a sink session that serves the fixtures as the
+stage and counts what would be loaded, so the numbers cover download (a local copy),
+extraction and load preparation, not the network.
+
+Every case runs in a fresh process so its peak RSS is its own.  Results are appended
+as JSON lines to --output, one line per case, and each case is compared with the last
+result for the same case and settings in that file.
+
+Usage (from the job_container directory):
+    python benchmarks/bench_ingest.py --scale 1 --repeat 3
+    python benchmarks/bench_ingest.py --fixtures /data/access --extract-mode typed
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+import synthetic_mdbtools
+from synthetic_mdbtools import table_spec
+
+
+def synthetic_cases(scale: float) -> dict:
+    """
+    The synthetic database shapes, as lists of table_spec descriptions.
+    """
+    def n(rows):
+        return max(1, int(rows * scale))
+
+    mixed = ["int", "text", "float", "datetime", "bool", "text"]
+    return {
+        "many_small_tables": [table_spec(f"small_{t}", n(500), mixed) for t in range(200)],
+        "one_huge_table": [table_spec("huge", n(500000), mixed + ["int", "float", "text", "datetime"])],
+        "wide_tables": [table_spec(f"wide_{t}", n(5000), (mixed * 34)[:200]) for t in range(5)],
+        "memo_heavy": [table_spec(f"memo_{t}", n(10000), ["int", "text", "memo", "memo"], memo_chars=4000)
+                       for t in range(3)],
+    }
+
+
+class _Result:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+
+    def collect(self):
+        return self.rows
+
+
+class _FileOperations:
+    def __init__(self, stage_dir: str):
+        self.stage_dir = stage_dir
+
+    def get(self, stage_location: str, target_directory: str, parallel: int = 4):
+        filename = stage_location.split("/")[-1]
+        shutil.copy(os.path.join(self.stage_dir, filename), target_directory)
+        return [_Result()]
+
+    def put(self, local_file_name: str, stage_location: str, **kwargs):
+        return [_Result()]
+
+
+class SinkSession:
+    """
+    Just enough of a Snowpark session for process_file: GET copies from a local
+    directory, queries return no rows and write_pandas only counts rows.
+    """
+
+    def __init__(self, stage_dir: str):
+        self.file = _FileOperations(stage_dir)
+        self.rows_loaded = 0
+
+    def sql(self, query: str):
+        return _Result()
+
+    def write_pandas(self, df, table_name: str, **kwargs):
+        self.rows_loaded += len(df)
+
+
+def run_case(path: str, config: dict, repeat: int) -> dict:
+    """
+    Processes one database repeat times in this process and returns the fastest run.
+    Meant to run in a fresh process.
+    """
+    import metrics
+    import utils
+
+    timings = []
+    peak_rss_mb = 0.0
+    for _ in range(repeat):
+        session = SinkSession(os.path.dirname(path))
+        run = metrics.RunMetrics()
+        with metrics.collect(run), metrics.file(os.path.basename(path)), metrics.phase("file"):
+            start = time.perf_counter()
+            result = utils.process_file(session, os.path.basename(path), "BENCH", dict(config))
+            seconds = time.perf_counter() - start
+        if result is None:
+            raise RuntimeError(f"process_file failed for {path}")
+        data_bytes = sum(r["bytes"] for r in run.records if r["phase"] == "extract")
+        timings.append((seconds, sum(result.values()), len(result), data_bytes))
+        # The phases reset the kernel's high-water mark, so ru_maxrss no longer covers the run
+        peak_rss_mb = max([peak_rss_mb] + [r["peak_rss_mb"] for r in run.records])
+    seconds, rows, tables, data_bytes = min(timings)
+    return {
+        "seconds": seconds,
+        "rows": rows,
+        "tables": tables,
+        "data_mb": data_bytes / 1e6,
+        "rows_per_s": rows / seconds,
+        "mb_per_s": data_bytes / 1e6 / seconds,
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _previous_results(output: str) -> dict:
+    previous = {}
+    try:
+        with open(output) as f:
+            for line in f:
+                result = json.loads(line)
+                previous[(result["case"], result["source"], json.dumps(result["config"], sort_keys=True))] = result
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="directory of real .mdb/.accdb files (default: synthetic databases)")
+    parser.add_argument("--scale", type=float, default=1.0, help="row count multiplier for synthetic databases")
+    parser.add_argument("--cases", nargs="+", help="only run these cases")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--table-workers", type=int, default=1)
+    parser.add_argument("--extract-mode", choices=["rows", "typed"], default="rows")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "bench_ingest.jsonl"))
+    args = parser.parse_args()
+
+    config = {
+        "batch_size": args.batch_size,
+        "table_workers": args.table_workers,
+        "extract_mode": args.extract_mode,
+        "load_mode": "variant",
+        "memory_download_mb": 0,
+    }
+    work_dir = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        if args.fixtures:
+            cases = {os.path.splitext(name)[0]: os.path.join(args.fixtures, name)
+                     for name in sorted(os.listdir(args.fixtures))
+                     if name.lower().endswith((".mdb", ".accdb"))}
+            source = "fixtures"
+        else:
+            cases = {name: synthetic_mdbtools.write_database(os.path.join(work_dir, f"{name}.mdb"), tables)
+                     for name, tables in synthetic_cases(args.scale).items()}
+            source = f"synthetic x{args.scale:g}"
+            bin_dir = synthetic_mdbtools.install(os.path.join(work_dir, "bin"))
+            # Inherited by the case processes and their mdb-* subprocesses
+            os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+        if args.cases:
+            cases = {name: path for name, path in cases.items() if name in args.cases}
+
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        previous = _previous_results(args.output)
+        context = multiprocessing.get_context("spawn")
+        print(f"{'case':<20} {'rows':>10} {'seconds':>9} {'rows/s':>10} {'MB/s':>8} {'peak MB':>8} {'vs last':>8}")
+        for name, path in cases.items():
+            with context.Pool(1) as pool:
+                measured = pool.apply(run_case, (path, config, args.repeat))
+            result = {
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "commit": _git_commit(),
+                "host": platform.node(),
+                "python": platform.python_version(),
+                "source": source,
+                "case": name,
+                "config": config,
+                **measured,
+            }
+            last = previous.get((name, source, json.dumps(config, sort_keys=True)))
+            change = f"{result['rows_per_s'] / last['rows_per_s'] - 1:+.0%}" if last else ""
+            print(f"{name:<20} {result['rows']:>10} {result['seconds']:>9.2f} {result['rows_per_s']:>10.0f} "
+                  f"{result['mb_per_s']:>8.1f} {result['peak_rss_mb']:>8.0f} {change:>8}")
+            with open(args.output, "a") as f:
+                f.write(json.dumps(result) + "\n")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Stand-in for mdb-tables, mdb-export and mdb-schema over synthetic Access databases,
+used by bench_ingest.py when no real .mdb/.accdb fixtures are given.
+
+A synthetic database is a JSON file describing its tables; the data is generated
+deterministically while it is exported, in the same CSV dialect as mdb-export, so
+fixtures of any size cost no disk space.  This exercises everything after mdbtools
+(parsing, batching, typing, loading); the cost of mdbtools itself is only measured
+with real fixtures.
+
+Usage:
+    python synthetic_mdbtools.py mdb-tables -1 <file>
+    python synthetic_mdbtools.py mdb-export [-D <format>] <file> <table>
+    python synthetic_mdbtools.py mdb-schema -T <table> <file> access
+"""
+import csv
+import datetime
+import json
+import os
+import stat
+import sys
+
+# Synthetic column types and the Access type mdb-schema reports for them
+ACCESS_TYPES = {
+    "int": "Long Integer",
+    "float": "Double",
+    "currency": "Currency",
+    "datetime": "DateTime",
+    "bool": "Boolean",
+    "text": "Text (255)",
+    "memo": "Memo/Hyperlink (255)",
+}
+
+WORDS = ["north", "south", "east", "west", "order", "invoice", "customer", "product", "shipment", "account"]
+
+
+def table_spec(name: str, rows: int, columns: list, memo_chars: int = 0) -> dict:
+    """
+    Describes a synthetic table: columns is a list of synthetic types (see ACCESS_TYPES).
+    """
+    return {"name": name, "rows": rows, "columns": columns, "memo_chars": memo_chars}
+
+
+def write_database(path: str, tables: list) -> str:
+    """
+    Writes a synthetic database file made of table_spec descriptions.
+    """
+    with open(path, "w") as f:
+        json.dump({"synthetic_access_database": 1, "tables": tables}, f)
+    return path
+
+
+def install(bin_dir: str) -> str:
+    """
+    Creates mdb-tables, mdb-export and mdb-schema wrappers in bin_dir that run this
+    script.  Put bin_dir first on PATH to use them.
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    script = os.path.abspath(__file__)
+    for command in ("mdb-tables", "mdb-export", "mdb-schema"):
+        wrapper = os.path.join(bin_dir, command)
+        with open(wrapper, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" {command} "$@"\n')
+        os.chmod(wrapper, os.stat(wrapper).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return {table["name"]: table for table in json.load(f)["tables"]}
+
+
+def _column_names(table: dict) -> list:
+    return [f"{kind}_{index}" for index, kind in enumerate(table["columns"])]
+
+
+def _value(kind: str, row: int, column: int, memo_chars: int, date_format: str):
+    if kind == "int":
+        return row * 31 + column
+    if kind == "float":
+        return round((row * 7 + column) / 3, 4)
+    if kind == "currency":
+        return f"{row * 1000003 + column}.{row % 10000:04d}"
+    if kind == "datetime":
+        return (datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=row * 13 + column)).strftime(date_format)
+    if kind == "bool":
+        return (row + column) % 2
+    if kind == "memo":
+        text = " ".join(WORDS[(row + i) % len(WORDS)] for i in range(memo_chars // 7 + 1))
+        return text[:memo_chars]
+    return f"{WORDS[(row + column) % len(WORDS)]} {row}"
+
+
+def export(path: str, table_name: str, date_format: str) -> None:
+    table = _load(path)[table_name]
+    # mdb-export quotes text and dates but not numbers
+    writer = csv.writer(sys.stdout, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+    sys.stdout.write(",".join(_column_names(table)) + "\n")
+    for row in range(table["rows"]):
+        writer.writerow([_value(kind, row, column, table["memo_chars"], date_format)
+                         for column, kind in enumerate(table["columns"])])
+
+
+def schema(path: str, table_name: str) -> None:
+    table = _load(path)[table_name]
+    lines = [f"\t[{name}]\t\t\t{ACCESS_TYPES[kind]}" for name, kind in zip(_column_names(table), table["columns"])]
+    print(f"CREATE TABLE [{table_name}]\n (")
+    print(",\n".join(lines))
+    print(");")
+
+
+def main(argv: list) -> int:
+    command, args = argv[0], argv[1:]
+    if command == "mdb-tables":
+        print("\n".join(_load(args[-1])))
+    elif command == "mdb-export":
+        date_format = "%m/%d/%y %H:%M:%S"
+        if args[0] == "-D":
+            date_format, args = args[1], args[2:]
+        export(args[0], args[1], date_format)
+    elif command == "mdb-schema":
+        schema(args[2], args[1])
+    else:
+        print(f"Unknown command {command}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
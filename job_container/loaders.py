@@ -0,0 +1,803 @@
+import datetime
+import itertools
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from snowflake.snowpark import Session
+import memory_governor
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Column of the Parquet load files holding the Access table name; it is moved out of
+# the row object by the COPY INTO transformation.
+PARQUET_TABLE_COLUMN = "__msaccess_table"
+
+
+def get_target_table_name(filename: str, now: datetime.datetime) -> str:
+    """
+    Builds the name of the per-file target table, <filename>_<timestamp>.
+    """
+    timestamp_string = now.strftime("%Y%m%d_%H%M%S")
+    return f"{filename.replace('.','_')}_{timestamp_string}"
+
+
+def frame_to_rows(frame: pd.DataFrame) -> List[dict]:
+    """
+    Converts a typed batch from MSAccessUtils.read_table_frames to one dictionary per
+    row for the VARIANT 'row' column.  Numbers and booleans keep their types,
+    timestamps become ISO 8601 strings, exact decimals become strings so that no digits
+    are lost on the way to JSON, and missing values become None.
+    """
+    frame = frame.copy()
+    for name in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[name]):
+            frame[name] = frame[name].dt.strftime("%Y-%m-%dT%H:%M:%S")
+        elif _is_decimal_dtype(frame[name].dtype):
+            frame[name] = frame[name].astype(pd.ArrowDtype(pa.string()))
+    frame = frame.astype(object)
+    return frame.where(frame.notna(), None).to_dict("records")
+
+
+def batch_nbytes(batch: Union[List[dict], pd.DataFrame]) -> int:
+    """
+    Approximates the memory a batch takes: the size of the Python objects of row
+    dictionaries (each dictionary and its values; the keys are shared by all rows),
+    extrapolated from the first 100 rows, or the memory used by the columns of a
+    DataFrame.  A str object has about 50 bytes of overhead and a row dictionary a few
+    hundred, so this is many times the length of the values themselves.
+    """
+    if isinstance(batch, pd.DataFrame):
+        return int(batch.memory_usage(index=False, deep=True).sum())
+    # Sampling keeps this cheap enough to call for every batch.
+    sample = batch[:100]
+    if not sample:
+        return 0
+    sample_bytes = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values()) for row in sample)
+    return sample_bytes * len(batch) // len(sample) + sys.getsizeof(batch)
+
+
+def build_load_frame(
+    tables: Iterable[Tuple[str, Union[List[dict], pd.DataFrame]]],
+    filename: str,
+    now: datetime.datetime
+) -> pd.DataFrame:
+    """
+    Builds the frame loaded into the per-file target table from (Access table name,
+    batch) pairs in a single pass.  The 'table_name' and 'row' columns are filled by
+    extending one list each, so the cost is linear in the number of rows no matter how
+    many tables there are, and nothing built so far is copied again.
+
+    Args:
+        tables: (Access table name, rows or typed batch) pairs.
+        filename: The name of the Access file the rows come from.
+        now: The load timestamp.
+
+    Returns:
+        pd.DataFrame: Columns table_name, row, filename and timestamp.
+    """
+    table_names = []
+    rows = []
+    for table_name, batch in tables:
+        batch_rows = frame_to_rows(batch) if isinstance(batch, pd.DataFrame) else batch
+        rows.extend(batch_rows)
+        table_names.extend(itertools.repeat(table_name, len(batch_rows)))
+    return pd.DataFrame({'table_name': table_names, 'row': rows, "filename": filename, "timestamp": now},
+                        columns=['table_name', 'row', "filename", "timestamp"])
+
+
+def sql_string(value: str) -> str:
+    """
+    Quotes a value as a SQL string literal.
+    """
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _commit_table(session: Session, staging_table_name: str, target_table_name: str) -> None:
+    """
+    Publishes a fully loaded staging table under the target name.  The rename is a
+    single metadata operation, so readers see either no table or the complete one.
+    """
+    session.sql(f'DROP TABLE IF EXISTS "{target_table_name}"').collect()
+    session.sql(f'ALTER TABLE "{staging_table_name}" RENAME TO "{target_table_name}"').collect()
+
+
+class _BackgroundUploader:
+    """
+    Runs uploads on a single background thread so the next chunk can be extracted
+    while the current one is uploaded.  submit() waits for the previous upload first,
+    so at most one chunk is uploading and one is being filled at any time, unless the
+    memory governor accounts for the queued chunks (wait_previous=False).
+    """
+
+    def __init__(self, name: str):
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.futures = []
+
+    def submit(self, fn, *args, wait_previous: bool = True) -> None:
+        """
+        Starts fn(*args) once the previous uploads are done, or with wait_previous=False
+        queues it behind them.  Re-raises the error of a finished upload, if any.
+        """
+        if wait_previous:
+            self.wait()
+        else:
+            done = [future for future in self.futures if future.done()]
+            self.futures = [future for future in self.futures if not future.done()]
+            for future in done:
+                future.result()
+        self.futures.append(self.pool.submit(fn, *args))
+
+    def wait(self) -> None:
+        """
+        Waits for the queued uploads and re-raises the first error, if any.
+        """
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+    def close(self) -> None:
+        """
+        Waits for the queued uploads, then stops the thread.
+        """
+        try:
+            self.wait()
+        finally:
+            self.pool.shutdown(wait=True)
+
+
+class _ChunkedLoader:
+    """
+    Groups the batches of one Access file into chunks of at most chunk_rows rows or
+    chunk_bytes bytes of memory (as estimated by batch_nbytes) and uploads each chunk in the background as soon as it is full,
+    so container memory stays flat no matter how large the file is.  Chunks go to a
+    staging table that only replaces the target table once the whole file is loaded;
+    abort() drops it, so a failed file leaves no partial target table behind.
+
+    Subclasses implement _upload_chunk(chunk, chunk_index) and _load_staging_table().
+    """
+
+    def __init__(self, session: Session, filename: str, now: Optional[datetime.datetime] = None,
+                 chunk_rows: int = 100000, chunk_bytes: int = 64 * 1024 * 1024):
+        self.session = session
+        self.filename = filename
+        self.now = now or datetime.datetime.now()
+        self.target_table_name = get_target_table_name(filename, self.now)
+        self.staging_table_name = f"{self.target_table_name}__LOADING"
+        self.chunk_rows = chunk_rows
+        self.chunk_bytes = chunk_bytes
+        self.pending = []
+        self.pending_rows = 0
+        self.pending_bytes = 0
+        self.chunks = 0
+        self.rows_written = 0
+        # Rows handed to the upload per Access table: what the file actually loads
+        self.loaded_rows: Dict[str, int] = {}
+        self.uploader = _BackgroundUploader(f"upload-{filename}")
+        # Bytes of the pending chunk reserved with the memory governor, if there is one
+        self.governor = memory_governor.get_governor()
+        self.reserved = 0
+        self.spill_dir = None
+        self.spilled_chunks = 0
+
+    def write_batch(self, table_name: str, batch: Union[List[dict], pd.DataFrame]) -> None:
+        """
+        Adds one batch of an Access table, either rows as dictionaries or a typed
+        DataFrame from MSAccessUtils.read_table_frames, to the current chunk.  Under a
+        memory budget this waits until the batch fits, spilling the chunk being filled
+        to disk first so its memory is freed while the uploads catch up.  If the budget
+        is still full after the governor's wait_seconds, the batch goes to disk too.
+        """
+        if len(batch) == 0:
+            return
+        nbytes = batch_nbytes(batch)
+        self.loaded_rows[table_name] = self.loaded_rows.get(table_name, 0) + len(batch)
+        reserved = self.governor is None or self._reserve(nbytes)
+        self.pending.append((table_name, batch))
+        self.pending_rows += len(batch)
+        self.pending_bytes += nbytes
+        if not reserved:
+            self._flush(spill=True)
+        elif self.pending_rows >= self.chunk_rows or self.pending_bytes >= self.chunk_bytes:
+            self._flush()
+
+    def _reserve(self, nbytes: int) -> bool:
+        if not self.governor.try_acquire(nbytes):
+            if self.pending:
+                self._flush(spill=True)
+            if not self.governor.acquire(nbytes, self.governor.wait_seconds):
+                logger.warning(f"Memory budget still full after {self.governor.wait_seconds}s, "
+                               f"spilling a batch of '{self.filename}' to disk")
+                return False
+        self.reserved += nbytes
+        return True
+
+    def finish(self) -> None:
+        """
+        Uploads the last chunk, waits for all uploads and publishes the target table.
+        """
+        self._flush()
+        self.uploader.close()
+        if self.chunks:
+            self._load_staging_table()
+            _commit_table(self.session, self.staging_table_name, self.target_table_name)
+
+    def abort(self) -> None:
+        """
+        Discards everything loaded so far.  Never raises.
+        """
+        self.pending = []
+        self._release_reserved()
+        try:
+            self.uploader.close()
+        except Exception:
+            pass
+        try:
+            self.session.sql(f'DROP TABLE IF EXISTS "{self.staging_table_name}"').collect()
+        except Exception as e:
+            logger.warning(f"Could not drop staging table {self.staging_table_name}: {e}")
+
+    def _flush(self, spill: bool = False) -> None:
+        if not self.pending:
+            return
+        chunk = self.pending
+        self.pending = []
+        if self.governor is None:
+            self.uploader.submit(metrics.bind(self._timed_upload), chunk, self.chunks, self.pending_rows, self.pending_bytes)
+        elif spill:
+            with metrics.phase("spill", rows=self.pending_rows, nbytes=self.pending_bytes):
+                path = memory_governor.spill(chunk, self.spill_dir or tempfile.gettempdir())
+            del chunk
+            self._release_reserved()
+            self.spilled_chunks += 1
+            self.uploader.submit(metrics.bind(self._upload_spilled), path, self.chunks, self.pending_rows,
+                                 self.pending_bytes, wait_previous=False)
+        else:
+            reserved, self.reserved = self.reserved, 0
+            self.uploader.submit(metrics.bind(self._upload_reserved), chunk, self.chunks, self.pending_rows,
+                                 self.pending_bytes, reserved, wait_previous=False)
+        self.chunks += 1
+        self.rows_written += self.pending_rows
+        self.pending_rows = 0
+        self.pending_bytes = 0
+
+    def _timed_upload(self, chunk, chunk_index: int, rows: int, nbytes: int) -> None:
+        with metrics.phase("upload", rows=rows, nbytes=nbytes):
+            self._upload_chunk(chunk, chunk_index)
+
+    def _upload_reserved(self, chunk, chunk_index: int, rows: int, nbytes: int, reserved: int) -> None:
+        try:
+            self._timed_upload(chunk, chunk_index, rows, nbytes)
+        finally:
+            self.governor.release(reserved)
+
+    def _upload_spilled(self, path: str, chunk_index: int, rows: int, nbytes: int) -> None:
+        self._timed_upload(memory_governor.unspill(path), chunk_index, rows, nbytes)
+
+    def _release_reserved(self) -> None:
+        if self.governor is not None:
+            self.governor.release(self.reserved)
+        self.reserved = 0
+
+    def _upload_chunk(self, chunk: List[Tuple[str, Union[List[dict], pd.DataFrame]]], chunk_index: int) -> None:
+        raise NotImplementedError
+
+    def _load_staging_table(self) -> None:
+        pass
+
+
+class VariantTableLoader(_ChunkedLoader):
+    """
+    Loads the tables of one Access file into the per-file <filename>_<timestamp> table,
+    one row per Access row in the VARIANT 'row' column, with one write_pandas call per
+    chunk.
+    """
+
+    def __init__(self, session: Session, filename: str, now: Optional[datetime.datetime] = None,
+                 chunk_rows: int = 100000, chunk_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            session (Session): The Snowpark session to use.
+            filename (str): The name of the Access file being loaded.
+            now (datetime, optional): The load timestamp.  Defaults to the current time.
+            chunk_rows (int, optional): Maximum rows per upload. Defaults to 100000.
+            chunk_bytes (int, optional): Maximum memory per upload (see batch_nbytes). Defaults to 64 MB.
+        """
+        super().__init__(session, filename, now, chunk_rows, chunk_bytes)
+
+    def _upload_chunk(self, chunk, chunk_index):
+        df = build_load_frame(chunk, self.filename, self.now)
+        # The first chunk (re)creates the staging table, the rest append.
+        self.session.write_pandas(df, self.staging_table_name, auto_create_table=True, overwrite=chunk_index == 0)
+
+
+class ParquetStageLoader(_ChunkedLoader):
+    """
+    Loads the tables of one Access file into the per-file <filename>_<timestamp> table
+    through an internal stage: every chunk is written as compressed Parquet files (one
+    per Access table in the chunk) in the scratch directory and PUT in the background,
+    and a single COPY INTO loads them all once the file is extracted.  This avoids the
+    per-row Python work of write_pandas on dictionaries, and the time spent in each
+    phase is logged for comparison.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        filename: str,
+        scratch_dir: str,
+        load_stage: str = "MSACCESS_LOAD",
+        parallel: int = 4,
+        compression: str = "snappy",
+        now: Optional[datetime.datetime] = None,
+        chunk_rows: int = 100000,
+        chunk_bytes: int = 64 * 1024 * 1024
+    ):
+        """
+        Args:
+            session (Session): The Snowpark session to use.
+            filename (str): The name of the Access file being loaded.
+            scratch_dir (str): Local directory for the Parquet files.
+            load_stage (str, optional): Internal stage for the upload.  Created as a
+                temporary stage if it does not exist.  Defaults to "MSACCESS_LOAD".
+            parallel (int, optional): Number of threads used by PUT. Defaults to 4.
+            compression (str, optional): Parquet compression codec. Defaults to "snappy".
+            now (datetime, optional): The load timestamp.  Defaults to the current time.
+            chunk_rows (int, optional): Maximum rows per upload. Defaults to 100000.
+            chunk_bytes (int, optional): Maximum memory per upload (see batch_nbytes). Defaults to 64 MB.
+        """
+        super().__init__(session, filename, now, chunk_rows, chunk_bytes)
+        self.stage_path = f"{load_stage}/{self.target_table_name}"
+        self.load_stage = load_stage
+        self.parallel = parallel
+        self.compression = compression
+        self.local_dir = os.path.join(scratch_dir, "parquet")
+        os.makedirs(self.local_dir, exist_ok=True)
+        self.parts = 0
+        self.bytes_written = 0
+        self.timings = {"write": 0.0, "put": 0.0, "copy": 0.0}
+        self.session.sql(f"CREATE TEMPORARY STAGE IF NOT EXISTS {self.load_stage}").collect()
+
+    def _upload_chunk(self, chunk, chunk_index):
+        start = time.monotonic()
+        # A Parquet file has a single schema, so each Access table gets its own file.
+        by_table = {}
+        for table_name, batch in chunk:
+            by_table.setdefault(table_name, []).append(batch)
+        paths = []
+        for table_name, batches in by_table.items():
+            if isinstance(batches[0], pd.DataFrame):
+                frame = pd.concat(batches, ignore_index=True) if len(batches) > 1 else batches[0]
+            else:
+                frame = pd.DataFrame([row for batch in batches for row in batch])
+            frame = frame.assign(**{PARQUET_TABLE_COLUMN: table_name})
+            path = os.path.join(self.local_dir, f"chunk_{chunk_index:06d}_{len(paths):04d}.parquet")
+            frame.to_parquet(path, compression=self.compression, index=False)
+            self.bytes_written += os.path.getsize(path)
+            paths.append(path)
+        self.parts += len(paths)
+        self.timings["write"] += time.monotonic() - start
+
+        start = time.monotonic()
+        self.session.file.put(os.path.join(self.local_dir, f"chunk_{chunk_index:06d}_*.parquet"), f"@{self.stage_path}",
+                              parallel=self.parallel, auto_compress=False, overwrite=True)
+        self.timings["put"] += time.monotonic() - start
+        for path in paths:
+            os.remove(path)
+
+    def _load_staging_table(self):
+        start = time.monotonic()
+        self.session.sql(f"""
+            CREATE OR REPLACE TABLE "{self.staging_table_name}" (
+                "table_name" VARCHAR, "row" VARIANT, "filename" VARCHAR, "timestamp" TIMESTAMP_NTZ
+            )
+        """).collect()
+        self.session.sql(f"""
+            COPY INTO "{self.staging_table_name}" ("table_name", "row", "filename", "timestamp")
+            FROM (
+                SELECT $1:{PARQUET_TABLE_COLUMN}::VARCHAR,
+                       OBJECT_DELETE($1, '{PARQUET_TABLE_COLUMN}'),
+                       {sql_string(self.filename)},
+                       {sql_string(self.now.strftime('%Y-%m-%d %H:%M:%S.%f'))}::TIMESTAMP_NTZ
+                FROM @{self.stage_path}/
+            )
+            FILE_FORMAT = (TYPE = PARQUET)
+            PURGE = TRUE
+        """).collect()
+        self.timings["copy"] = time.monotonic() - start
+        logger.info(f"Parquet load of '{self.filename}' into {self.target_table_name}: "
+                    f"{self.rows_written} rows, {self.parts} files, {self.bytes_written / 1e6:.1f} MB; "
+                    f"write {self.timings['write']:.2f}s, put {self.timings['put']:.2f}s, copy {self.timings['copy']:.2f}s")
+
+    def abort(self):
+        super().abort()
+        try:
+            self.session.sql(f"REMOVE @{self.stage_path}/").collect()
+        except Exception as e:
+            logger.warning(f"Could not remove staged load files in @{self.stage_path}: {e}")
+
+
+def native_table_name(access_table_name: str, prefix: str = "") -> str:
+    """
+    Builds the Snowflake table name for an Access table in native mode: the prefix and
+    the Access name upper-cased, with anything but letters, digits and _ replaced by _.
+    """
+    return re.sub(r"[^A-Za-z0-9_]", "_", f"{prefix}{access_table_name}").upper()
+
+
+def _is_decimal_dtype(dtype) -> bool:
+    return isinstance(dtype, pd.ArrowDtype) and pa.types.is_decimal(dtype.pyarrow_dtype)
+
+
+def snowflake_column_type(dtype) -> str:
+    """
+    Maps the pandas type of a typed batch column (see MSAccessUtils.read_table_frames)
+    to the Snowflake column type used in native mode.
+    """
+    if _is_decimal_dtype(dtype):
+        return f"NUMBER({dtype.pyarrow_dtype.precision},{dtype.pyarrow_dtype.scale})"
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "NUMBER(38,0)"
+    if pd.api.types.is_float_dtype(dtype):
+        return "FLOAT"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP_NTZ"
+    return "VARCHAR"
+
+
+class NativeTableLoader(_ChunkedLoader):
+    """
+    Loads each Access table of a file into its own typed Snowflake table, created on
+    first use with one column per Access column plus _FILENAME and _LOADED_AT, and
+    appended to by every later file.  Downstream queries can then prune by column
+    instead of parsing the VARIANT rows of a per-file table.
+
+    Chunks are written to per-file staging tables; finish() appends all of them to
+    their target tables in one transaction, so a file is either fully loaded or not
+    at all.  Expects typed batches (extract_mode "typed").
+    """
+
+    def __init__(self, session: Session, filename: str, table_prefix: str = "",
+                 now: Optional[datetime.datetime] = None,
+                 chunk_rows: int = 100000, chunk_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            session (Session): The Snowpark session to use.
+            filename (str): The name of the Access file being loaded.
+            table_prefix (str, optional): Prefix for the target table names. Defaults to "".
+            now (datetime, optional): The load timestamp.  Defaults to the current time.
+            chunk_rows (int, optional): Maximum rows per upload. Defaults to 100000.
+            chunk_bytes (int, optional): Maximum memory per upload (see batch_nbytes). Defaults to 64 MB.
+        """
+        super().__init__(session, filename, now, chunk_rows, chunk_bytes)
+        self.table_prefix = table_prefix
+        # target table name -> (staging table name, {column name: Snowflake type})
+        self.staging_tables = {}
+        self.target_table_name = "(no tables)"
+
+    def _upload_chunk(self, chunk, chunk_index):
+        by_table = {}
+        for table_name, batch in chunk:
+            frame = batch if isinstance(batch, pd.DataFrame) else pd.DataFrame(batch)
+            by_table.setdefault(table_name, []).append(frame)
+        for table_name, frames in by_table.items():
+            frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            frame = frame.assign(_FILENAME=self.filename, _LOADED_AT=self.now)
+            target = native_table_name(table_name, self.table_prefix)
+            first_chunk = target not in self.staging_tables
+            if first_chunk:
+                staging = f"{target}__{get_target_table_name(self.filename, self.now)}__LOADING"
+                self.staging_tables[target] = (staging, {name: snowflake_column_type(dtype) for name, dtype in frame.dtypes.items()})
+                self.target_table_name = ", ".join(self.staging_tables)
+            staging = self.staging_tables[target][0]
+            self.session.write_pandas(frame, staging, auto_create_table=True, overwrite=first_chunk,
+                                      table_type="transient", use_logical_type=True)
+
+    def _load_staging_table(self):
+        statements = []
+        for target, (staging, columns) in self.staging_tables.items():
+            column_ddl = ", ".join(f'"{name}" {column_type}' for name, column_type in columns.items())
+            self.session.sql(f'CREATE TABLE IF NOT EXISTS "{target}" ({column_ddl})').collect()
+            # Columns added to the Access table since the target was created
+            existing = {row["column_name"] for row in self.session.sql(f'SHOW COLUMNS IN TABLE "{target}"').collect()}
+            for name, column_type in columns.items():
+                if name not in existing:
+                    self.session.sql(f'ALTER TABLE "{target}" ADD COLUMN "{name}" {column_type}').collect()
+            column_list = ", ".join(f'"{name}"' for name in columns)
+            statements.append(f'INSERT INTO "{target}" ({column_list}) SELECT {column_list} FROM "{staging}";')
+        # One anonymous block, so the appends commit together or roll back together.
+        self.session.sql(f"""
+            EXECUTE IMMEDIATE $$
+            BEGIN
+                BEGIN TRANSACTION;
+                {" ".join(statements)}
+                COMMIT;
+            EXCEPTION
+                WHEN OTHER THEN
+                    ROLLBACK;
+                    RAISE;
+            END;
+            $$
+        """).collect()
+        self._drop_staging_tables()
+        logger.info(f"Native load of '{self.filename}': {self.rows_written} rows into {len(self.staging_tables)} tables")
+
+    def finish(self) -> None:
+        """
+        Uploads the last chunk, waits for all uploads and appends every staging table
+        to its target table in one transaction.
+        """
+        self._flush()
+        self.uploader.close()
+        if self.staging_tables:
+            self._load_staging_table()
+
+    def abort(self) -> None:
+        """
+        Discards everything loaded so far.  Never raises.
+        """
+        self.pending = []
+        self._release_reserved()
+        try:
+            self.uploader.close()
+        except Exception:
+            pass
+        self._drop_staging_tables()
+
+    def _drop_staging_tables(self) -> None:
+        for staging, _ in self.staging_tables.values():
+            try:
+                self.session.sql(f'DROP TABLE IF EXISTS "{staging}"').collect()
+            except Exception as e:
+                logger.warning(f"Could not drop staging table {staging}: {e}")
+
+
+def logical_database_name(filename: str, pattern: Optional[str] = None) -> str:
+    """
+    Names the logical database a file is an upload of, so recurring uploads of the same
+    database can be compared.  Without a pattern this is the filename without its
+    extension; with one, it is the first group of the regex match on the filename,
+    e.g. r"(.*?)_\\d{8}\\.mdb" for "sales_20261017.mdb".
+    """
+    if pattern:
+        match = re.match(pattern, filename)
+        if match:
+            return match.group(1)
+    return os.path.splitext(filename)[0]
+
+
+def row_hashes(frame: pd.DataFrame) -> np.ndarray:
+    """
+    Computes a stable 64-bit hash of every row of a batch, vectorized over the columns.
+    """
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
+
+
+def occurrence_hashes(hashes: np.ndarray, seen: pd.Series) -> Tuple[np.ndarray, pd.Series]:
+    """
+    Makes the row hashes of a batch unique per occurrence, so that identical rows of a
+    table without a key are told apart: the first occurrence of a row keeps its hash
+    and the n-th later one gets the hash of (row hash, n).
+
+    Args:
+        hashes: The row hashes of the batch, see row_hashes.
+        seen: How often each row hash occurred in the earlier batches of the table.
+
+    Returns:
+        The occurrence hashes and the updated counts for the next batch.
+    """
+    counts = pd.Series(hashes).value_counts()
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy(dtype=np.int64)
+    if len(seen):
+        occurrence = occurrence + seen.reindex(hashes, fill_value=0).to_numpy(dtype=np.int64)
+        counts = pd.concat([seen, counts]).groupby(level=0).sum()
+    repeated = occurrence > 0
+    unique_hashes = hashes.copy()
+    if repeated.any():
+        pairs = pd.DataFrame({"row_hash": hashes[repeated], "occurrence": occurrence[repeated]})
+        unique_hashes[repeated] = pd.util.hash_pandas_object(pairs, index=False).to_numpy().view(np.int64)
+    return unique_hashes, counts
+
+
+class IncrementalTableLoader(VariantTableLoader):
+    """
+    Loads only what changed since the previous upload of the same logical database.
+    Every row is hashed and compared with the row hashes stored for the previous load
+    in the row hashes table; rows with a new hash are loaded with change_type 'insert'
+    and hashes that disappeared are loaded as 'delete' markers (row_hash only, empty
+    row).  Without a key, a changed row shows up as a delete of its old hash and an
+    insert of its new content; identical rows get one hash per occurrence (see
+    occurrence_hashes), so adding or removing a copy of a row is a change too.  Rows go to the per-file <filename>_<timestamp> table
+    with the change_type and row_hash columns added; once that table is committed the
+    stored hashes are replaced by the ones of this upload in one transaction.
+    """
+
+    def __init__(self, session: Session, filename: str, hashes_table: str = "MSACCESS_ROW_HASHES",
+                 name_pattern: Optional[str] = None, now: Optional[datetime.datetime] = None,
+                 chunk_rows: int = 100000, chunk_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            session (Session): The Snowpark session to use.
+            filename (str): The name of the Access file being loaded.
+            hashes_table (str, optional): Table of the row hashes of the previous loads.
+                Defaults to "MSACCESS_ROW_HASHES".
+            name_pattern (str, optional): Regex for the logical database name, see
+                logical_database_name.
+            now (datetime, optional): The load timestamp.  Defaults to the current time.
+            chunk_rows (int, optional): Maximum rows per upload. Defaults to 100000.
+            chunk_bytes (int, optional): Maximum memory per upload (see batch_nbytes). Defaults to 64 MB.
+        """
+        super().__init__(session, filename, now, chunk_rows, chunk_bytes)
+        self.database_name = logical_database_name(filename, name_pattern)
+        self.hashes_table = hashes_table
+        self.hashes_staging_table = f"{hashes_table}__{self.target_table_name}__LOADING"
+        self.current_table = None
+        self.previous_hashes = np.empty(0, dtype=np.int64)
+        self.current_hashes = []
+        # Occurrences of each row hash in the batches of the current table so far
+        self.hash_counts = pd.Series(dtype=np.int64)
+        self.tables_seen = []
+        self.changes = {"insert": 0, "delete": 0}
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {self.hashes_table} (
+                DATABASE_NAME VARCHAR, TABLE_NAME VARCHAR, ROW_HASH NUMBER(19,0)
+            )
+        """).collect()
+
+    def _previous_hashes(self, table_name: Optional[str] = None) -> pd.DataFrame:
+        condition = f"TABLE_NAME = {sql_string(table_name)}" if table_name is not None else \
+            f"TABLE_NAME NOT IN ({', '.join(sql_string(t) for t in self.tables_seen) or 'NULL'})"
+        return self.session.sql(f"""
+            SELECT TABLE_NAME, ROW_HASH FROM {self.hashes_table}
+            WHERE DATABASE_NAME = {sql_string(self.database_name)} AND {condition}
+        """).to_pandas()
+
+    def write_batch(self, table_name: str, batch: Union[List[dict], pd.DataFrame]) -> None:
+        """
+        Hashes one batch of an Access table and passes on the rows that are new.
+        """
+        if len(batch) == 0:
+            return
+        if table_name != self.current_table:
+            self._end_table()
+            self.current_table = table_name
+            self.tables_seen.append(table_name)
+            self.previous_hashes = np.unique(self._previous_hashes(table_name)["ROW_HASH"].to_numpy(dtype=np.int64))
+        frame = batch if isinstance(batch, pd.DataFrame) else pd.DataFrame(batch)
+        hashes, self.hash_counts = occurrence_hashes(row_hashes(frame), self.hash_counts)
+        self.current_hashes.append(hashes)
+        new_rows = ~np.isin(hashes, self.previous_hashes)
+        if new_rows.any():
+            inserted = frame[new_rows].assign(**{"__change": "insert", "__row_hash": hashes[new_rows]})
+            self.changes["insert"] += len(inserted)
+            super().write_batch(table_name, inserted)
+
+    def _end_table(self) -> None:
+        """
+        Emits delete markers for the hashes of the current table that are gone and
+        stages its new hashes.
+        """
+        if self.current_table is None:
+            return
+        current = np.unique(np.concatenate(self.current_hashes)) if self.current_hashes else np.empty(0, dtype=np.int64)
+        self._emit_deletes(self.current_table, np.setdiff1d(self.previous_hashes, current, assume_unique=True))
+        self.session.write_pandas(
+            pd.DataFrame({"DATABASE_NAME": self.database_name, "TABLE_NAME": self.current_table, "ROW_HASH": current}),
+            self.hashes_staging_table, auto_create_table=True, overwrite=len(self.tables_seen) == 1,
+            table_type="transient")
+        self.current_hashes = []
+        self.hash_counts = pd.Series(dtype=np.int64)
+        self.previous_hashes = np.empty(0, dtype=np.int64)
+
+    def _emit_deletes(self, table_name: str, deleted: np.ndarray) -> None:
+        if len(deleted):
+            self.changes["delete"] += len(deleted)
+            super().write_batch(table_name, pd.DataFrame({"__change": "delete", "__row_hash": deleted}))
+
+    def _upload_chunk(self, chunk, chunk_index):
+        data = []
+        for table_name, frame in chunk:
+            rows = frame.drop(columns=["__change", "__row_hash"])
+            # Delete markers carry no columns but still need one empty row object each
+            data.append((table_name, rows if len(rows.columns) else [{}] * len(rows)))
+        df = build_load_frame(data, self.filename, self.now)
+        df["change_type"] = np.concatenate([frame["__change"].to_numpy(dtype=object) for _, frame in chunk])
+        df["row_hash"] = np.concatenate([frame["__row_hash"].to_numpy(dtype=np.int64) for _, frame in chunk])
+        self.session.write_pandas(df, self.staging_table_name, auto_create_table=True, overwrite=chunk_index == 0)
+
+    def finish(self) -> None:
+        """
+        Loads the changes, then replaces the stored hashes of the logical database with
+        the ones of this upload.
+        """
+        self._end_table()
+        # Tables that were in the previous upload but are empty or gone now
+        for table_name, gone in self._previous_hashes().groupby("TABLE_NAME"):
+            self._emit_deletes(table_name, gone["ROW_HASH"].to_numpy(dtype=np.int64))
+        super().finish()
+        replace_hashes = f"DELETE FROM {self.hashes_table} WHERE DATABASE_NAME = {sql_string(self.database_name)};"
+        if self.tables_seen:
+            replace_hashes += f' INSERT INTO {self.hashes_table} SELECT "DATABASE_NAME", "TABLE_NAME", "ROW_HASH" FROM "{self.hashes_staging_table}";'
+        self.session.sql(f"""
+            EXECUTE IMMEDIATE $$
+            BEGIN
+                BEGIN TRANSACTION;
+                {replace_hashes}
+                COMMIT;
+            EXCEPTION
+                WHEN OTHER THEN
+                    ROLLBACK;
+                    RAISE;
+            END;
+            $$
+        """).collect()
+        self.session.sql(f'DROP TABLE IF EXISTS "{self.hashes_staging_table}"').collect()
+        logger.info(f"Incremental load of '{self.filename}' (database '{self.database_name}'): "
+                    f"{self.changes['insert']} inserted, {self.changes['delete']} deleted rows into {self.target_table_name}")
+
+    def abort(self) -> None:
+        """
+        Discards everything loaded so far and keeps the stored hashes.  Never raises.
+        """
+        super().abort()
+        try:
+            self.session.sql(f'DROP TABLE IF EXISTS "{self.hashes_staging_table}"').collect()
+        except Exception as e:
+            logger.warning(f"Could not drop staging table {self.hashes_staging_table}: {e}")
+
+
+def create_loader(session: Session, filename: str, scratch_dir: str, config: Optional[Dict[str, Any]] = None):
+    """
+    Creates the loader selected by the load_mode setting of the configuration.
+
+    Args:
+        session: The Snowpark session to use.
+        filename: The name of the Access file being loaded.
+        scratch_dir: Local directory the loader may use for temporary files.
+        config: The [snowflake] section of the configuration file.  load_mode is
+                "variant" (default) for VariantTableLoader or "parquet" for
+                ParquetStageLoader, which also reads load_stage, put_parallel and
+                parquet_compression, "native" for NativeTableLoader, which reads
+                native_table_prefix, or "incremental" for IncrementalTableLoader,
+                which reads row_hashes_table and incremental_name_pattern.  All read
+                chunk_rows and chunk_mb.
+
+    Returns:
+        A loader with write_batch(table_name, batch), finish() and abort() methods.
+    """
+    loader = _create_loader(session, filename, scratch_dir, config or {})
+    # Chunks spilled under the memory budget go to the file's scratch directory
+    loader.spill_dir = os.path.join(scratch_dir, "spill") if scratch_dir else None
+    return loader
+
+
+def _create_loader(session: Session, filename: str, scratch_dir: str, config: Dict[str, Any]):
+    load_mode = config.get("load_mode", "variant")
+    chunk_rows = config.get("chunk_rows", 100000)
+    chunk_bytes = int(config.get("chunk_mb", 64) * 1024 * 1024)
+    if load_mode == "variant":
+        return VariantTableLoader(session, filename, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes)
+    if load_mode == "parquet":
+        return ParquetStageLoader(session, filename, scratch_dir,
+                                  load_stage=config.get("load_stage", "MSACCESS_LOAD"),
+                                  parallel=config.get("put_parallel", 4),
+                                  compression=config.get("parquet_compression", "snappy"),
+                                  chunk_rows=chunk_rows, chunk_bytes=chunk_bytes)
+    if load_mode == "native":
+        return NativeTableLoader(session, filename, config.get("native_table_prefix", ""),
+                                 chunk_rows=chunk_rows, chunk_bytes=chunk_bytes)
+    if load_mode == "incremental":
+        return IncrementalTableLoader(session, filename, config.get("row_hashes_table", "MSACCESS_ROW_HASHES"),
+                                      config.get("incremental_name_pattern"),
+                                      chunk_rows=chunk_rows, chunk_bytes=chunk_bytes)
+    raise ValueError(f"Unknown load_mode '{load_mode}'. Use 'variant', 'parquet', 'native' or 'incremental'.")
@@ -0,0 +1,365 @@
+import email.utils
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, IO, List, Optional, Tuple
+import pandas as pd
+import pyarrow.parquet as pq
+from snowflake.snowpark import Row
+
+logger = logging.getLogger(__name__)
+
+
+class LocalSession:
+    """
+    Offline stand-in for the Snowpark Session, for running and profiling the pipeline
+    without a Snowflake account.  Stages are directories under root_dir/stages and
+    tables live in the SQLite database root_dir/tables.sqlite.
+
+    It implements what the pipeline uses: LIST, SHOW STAGES, CREATE STAGE, COPY FILES
+    INTO, REMOVE, RESULT_SCAN(LAST_QUERY_ID()), SHOW COLUMNS, EXECUTE IMMEDIATE
+    transaction blocks, the Parquet COPY INTO of load_mode "parquet", file.get/put/
+    put_stream and write_pandas; other statements are run by SQLite after dropping
+    Snowflake-only syntax (::casts, TRANSIENT, QUALIFY).
+
+    Every round trip (query, file transfer, write_pandas) sleeps latency_ms, and file
+    transfers additionally sleep for their size at bandwidth_mbps, to model the cost
+    of talking to Snowflake.
+    """
+
+    def __init__(self, root_dir: str, latency_ms: float = 0, bandwidth_mbps: float = 0):
+        """
+        Args:
+            root_dir (str): Directory holding the stages and the table database.
+            latency_ms (float, optional): Simulated round-trip time. Defaults to 0.
+            bandwidth_mbps (float, optional): Simulated transfer rate in MB/s, 0 for
+                unlimited. Defaults to 0.
+        """
+        self.root_dir = root_dir
+        self.stage_root = os.path.join(root_dir, "stages")
+        os.makedirs(self.stage_root, exist_ok=True)
+        self.latency = latency_ms / 1000
+        self.bandwidth = bandwidth_mbps * 1e6
+        self.connection = sqlite3.connect(os.path.join(root_dir, "tables.sqlite"), timeout=60,
+                                          check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        self.last_result: List[Row] = []
+        self.file = _LocalFileOperations(self)
+
+    def sql(self, query: str) -> "LocalDataFrame":
+        return LocalDataFrame(self, query)
+
+    def write_pandas(self, df: pd.DataFrame, table_name: str, auto_create_table: bool = False,
+                     overwrite: bool = False, **kwargs) -> None:
+        """
+        Appends (or with overwrite, replaces) a table with the frame; VARIANT values
+        are stored as JSON text and exact decimals as decimal strings.
+        """
+        self._round_trip()
+        frame = df.copy()
+        for column in frame.columns:
+            if frame[column].dtype == object:
+                frame[column] = frame[column].map(lambda v: json.dumps(v, default=str) if isinstance(v, (dict, list)) else v)
+            elif pd.api.types.is_datetime64_any_dtype(frame[column]):
+                frame[column] = frame[column].astype(str)
+            elif isinstance(frame[column].dtype, pd.ArrowDtype):
+                frame[column] = frame[column].astype(str).where(frame[column].notna(), None)
+        with self.lock:
+            frame.to_sql(_unquote(table_name), self.connection, if_exists="replace" if overwrite else "append", index=False)
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def use_role(self, role: Optional[str]) -> None:
+        pass
+
+    def use_warehouse(self, warehouse: Optional[str]) -> None:
+        pass
+
+    def get_current_user(self) -> str:
+        return '"LOCAL"'
+
+    def _round_trip(self, nbytes: int = 0) -> None:
+        delay = self.latency + (nbytes / self.bandwidth if self.bandwidth else 0)
+        if delay:
+            time.sleep(delay)
+
+    def _stage_dir(self, location: str) -> str:
+        """
+        Maps "@STAGE/path" (or "STAGE/path") to its directory; stage names are case
+        insensitive like unquoted Snowflake identifiers.
+        """
+        stage, _, path = location.lstrip("@").strip("'\"").partition("/")
+        return os.path.join(self.stage_root, stage.upper(), path.strip("/"))
+
+    def execute(self, query: str) -> Tuple[List[Row], List[str]]:
+        """
+        Runs one statement and returns its rows and column names.
+        """
+        self._round_trip()
+        statement = query.strip().rstrip(";").strip()
+        for pattern, handler in _HANDLERS:
+            match = pattern.match(statement)
+            if match:
+                rows = handler(self, match)
+                columns = list(rows[0].as_dict()) if rows else []
+                break
+        else:
+            for sqlite_statement in _to_sqlite(statement):
+                rows, columns = self._run_sqlite(sqlite_statement)
+        if not re.search(r"RESULT_SCAN", statement, re.IGNORECASE):
+            self.last_result = rows
+        return rows, columns
+
+    def _run_sqlite(self, statement: str) -> Tuple[List[Row], List[str]]:
+        with self.lock:
+            cursor = self.connection.execute(statement)
+            if cursor.description is None:
+                return [], []
+            columns = [d[0] for d in cursor.description]
+            return [Row(**dict(zip(columns, values))) for values in cursor.fetchall()], columns
+
+    def _list(self, match) -> List[Row]:
+        directory = self._stage_dir(match.group("location"))
+        pattern = match.group("pattern")
+        stage = match.group("location").lstrip("@").split("/")[0].lower()
+        rows = []
+        for dirpath, _, names in os.walk(directory):
+            for name in sorted(names):
+                path = os.path.join(dirpath, name)
+                listed = stage + "/" + os.path.relpath(path, self._stage_dir(stage)).replace(os.sep, "/")
+                if pattern and not re.fullmatch(_unescape(pattern), listed):
+                    continue
+                md5 = hashlib.md5()
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        md5.update(block)
+                rows.append(Row(name=listed, size=os.path.getsize(path), md5=md5.hexdigest(),
+                                last_modified=email.utils.formatdate(os.path.getmtime(path), usegmt=True)))
+        return rows
+
+    def _show_stages(self, match) -> List[Row]:
+        like = match.group("like")
+        stages = sorted(os.listdir(self.stage_root))
+        if like:
+            regex = re.escape(like).replace("%", ".*").replace("_", ".")
+            stages = [s for s in stages if re.fullmatch(regex, s, re.IGNORECASE)]
+        return [Row(name=s, created_on=None) for s in stages]
+
+    def _create_stage(self, match) -> List[Row]:
+        os.makedirs(self._stage_dir(match.group("stage")), exist_ok=True)
+        return [Row(status=f"Stage area {match.group('stage').upper()} successfully created.")]
+
+    def _copy_files(self, match) -> List[Row]:
+        source = self._stage_dir(match.group("source"))
+        target = self._stage_dir(match.group("target"))
+        os.makedirs(target, exist_ok=True)
+        rows = []
+        for name in re.findall(r"'((?:[^']|'')*)'", match.group("files")):
+            name = _unescape(name)
+            if os.path.isfile(os.path.join(source, name)):
+                shutil.copy2(os.path.join(source, name), os.path.join(target, name))
+                rows.append(Row(file=name))
+        return rows
+
+    def _remove(self, match) -> List[Row]:
+        location = match.group("location")
+        path = self._stage_dir(location)
+        stage = location.lstrip("@").split("/")[0].lower()
+        pattern = match.group("pattern")
+        if os.path.isfile(path):
+            candidates = [path]
+        else:
+            candidates = [os.path.join(d, n) for d, _, names in os.walk(path) for n in names]
+        rows = []
+        for file_path in candidates:
+            listed = stage + "/" + os.path.relpath(file_path, self._stage_dir(stage)).replace(os.sep, "/")
+            if pattern and not re.fullmatch(_unescape(pattern), listed):
+                continue
+            os.remove(file_path)
+            rows.append(Row(name=listed, result="removed"))
+        return rows
+
+    def _result_scan(self, match) -> List[Row]:
+        return self.last_result
+
+    def _show_columns(self, match) -> List[Row]:
+        columns, _ = self._run_sqlite(f'PRAGMA table_info("{_unquote(match.group("table"))}")')
+        return [Row(table_name=_unquote(match.group("table")), column_name=c["name"], data_type=c["type"])
+                for c in columns]
+
+    def _execute_block(self, match) -> List[Row]:
+        """
+        Runs the statements between BEGIN TRANSACTION and COMMIT of an EXECUTE
+        IMMEDIATE block in one SQLite transaction.
+        """
+        body = match.group("body")
+        transaction = re.search(r"BEGIN\s+TRANSACTION\s*;(.*)COMMIT\s*;", body, re.IGNORECASE | re.DOTALL)
+        statements = [s.strip() for s in (transaction.group(1) if transaction else body).split(";") if s.strip()]
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                for statement in statements:
+                    for sqlite_statement in _to_sqlite(statement):
+                        self.connection.execute(sqlite_statement)
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+        return [Row(anonymous_block=None)]
+
+    def _copy_into_table(self, match) -> List[Row]:
+        """
+        Loads the staged Parquet files of loaders.ParquetStageLoader: the table name
+        column of each record, the rest of the record as a JSON object, and the file
+        name and timestamp literals.
+        """
+        table_column = match.group("table_column")
+        literals = [_unescape(match.group("filename")), _unescape(match.group("timestamp"))]
+        columns = ", ".join(f'"{_unquote(c)}"' for c in match.group("columns").split(","))
+        directory = self._stage_dir(match.group("location"))
+        rows = []
+        for path in sorted(glob.glob(os.path.join(directory, "*.parquet"))):
+            records = pq.read_table(path).to_pylist()
+            values = [(record.pop(table_column), json.dumps(record, default=str), *literals) for record in records]
+            with self.lock:
+                self.connection.executemany(
+                    f'INSERT INTO "{_unquote(match.group("table"))}" ({columns}) VALUES (?, ?, ?, ?)', values)
+            if match.group("purge"):
+                os.remove(path)
+            rows.append(Row(file=os.path.basename(path), status="LOADED", rows_loaded=len(values)))
+        return rows
+
+
+class LocalDataFrame:
+    """
+    The lazily run result of LocalSession.sql, with the DataFrame methods the
+    pipeline calls.
+    """
+
+    def __init__(self, session: LocalSession, query: str):
+        self.session = session
+        self.query = query
+
+    def collect(self) -> List[Row]:
+        return self.session.execute(self.query)[0]
+
+    def count(self) -> int:
+        return len(self.collect())
+
+    def to_pandas(self) -> pd.DataFrame:
+        rows, columns = self.session.execute(self.query)
+        return pd.DataFrame([tuple(row) for row in rows], columns=columns)
+
+
+class _LocalFileOperations:
+    def __init__(self, session: LocalSession):
+        self.session = session
+
+    def get(self, stage_location: str, target_directory: str, parallel: int = 4, **kwargs) -> List[Row]:
+        source = self.session._stage_dir(stage_location)
+        os.makedirs(target_directory, exist_ok=True)
+        files = [source] if os.path.isfile(source) else \
+            [os.path.join(d, n) for d, _, names in os.walk(source) for n in names]
+        for path in files:
+            self.session._round_trip(os.path.getsize(path))
+            shutil.copy(path, target_directory)
+        return [Row(file=os.path.basename(p), size=os.path.getsize(p), status="DOWNLOADED") for p in files]
+
+    def put(self, local_file_name: str, stage_location: str, auto_compress: bool = True,
+            overwrite: bool = False, parallel: int = 4, **kwargs) -> List[Row]:
+        target = self.session._stage_dir(stage_location)
+        os.makedirs(target, exist_ok=True)
+        rows = []
+        for path in _glob_local(local_file_name):
+            self.session._round_trip(os.path.getsize(path))
+            shutil.copy(path, target)
+            rows.append(Row(source=os.path.basename(path), target=os.path.basename(path), status="UPLOADED"))
+        return rows
+
+    def put_stream(self, input_stream: IO[bytes], stage_location: str, auto_compress: bool = True,
+                   overwrite: bool = False, parallel: int = 4, **kwargs) -> Row:
+        target = self.session._stage_dir(stage_location)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        data = input_stream.read()
+        self.session._round_trip(len(data))
+        with open(target, "wb") as f:
+            f.write(data)
+        return Row(source=os.path.basename(target), target=os.path.basename(target), status="UPLOADED")
+
+
+def _glob_local(local_file_name: str) -> List[str]:
+    return sorted(glob.glob(local_file_name.replace("file://", "")))
+
+
+def _unescape(literal: str) -> str:
+    """
+    Undoes the quoting of loaders.sql_string inside a string literal.
+    """
+    return re.sub(r"\\(.)", r"\1", literal.replace("''", "'"))
+
+
+def _unquote(identifier: str) -> str:
+    return identifier.strip().strip('"')
+
+
+def _to_sqlite(statement: str) -> List[str]:
+    """
+    Drops the Snowflake-only syntax the pipeline uses from a statement, returning the
+    SQLite statements to run in order.
+    """
+    statement = re.sub(r"::\s*\w+(\s*\(\s*\d+(\s*,\s*\d+)?\s*\))?", "", statement)
+    statement = re.sub(r"\bCREATE\s+(TRANSIENT|TEMPORARY)\s+TABLE\b", "CREATE TABLE", statement, flags=re.IGNORECASE)
+    replace = re.match(r"\s*CREATE\s+OR\s+REPLACE\s+TABLE\s+(\S+)", statement, re.IGNORECASE)
+    if replace:
+        create = re.sub(r"CREATE\s+OR\s+REPLACE\s+TABLE", "CREATE TABLE", statement, count=1, flags=re.IGNORECASE)
+        return [f"DROP TABLE IF EXISTS {replace.group(1)}", create]
+    qualify = re.match(r"\s*SELECT\s+(?P<columns>.+?)\s+FROM\s+(?P<rest>.+?)\s+QUALIFY\s+(?P<condition>.+?)\s*=\s*1\s*$",
+                       statement, re.IGNORECASE | re.DOTALL)
+    if qualify:
+        statement = (f"SELECT {qualify.group('columns')} FROM (SELECT *, {qualify.group('condition')} AS __qualify "
+                     f"FROM {qualify.group('rest')}) WHERE __qualify = 1")
+    return [statement]
+
+
+_LOCATION = r"'?(?P<location>@[^'\s]+)'?"
+_HANDLERS = [(re.compile(pattern, re.IGNORECASE | re.DOTALL), handler) for pattern, handler in [
+    (rf"LIST\s+{_LOCATION}(\s+PATTERN\s*=\s*'(?P<pattern>(?:[^']|'')*)')?$", LocalSession._list),
+    (r"SHOW\s+STAGES(\s+LIKE\s+'(?P<like>[^']*)')?.*$", LocalSession._show_stages),
+    (r"CREATE\s+(TEMPORARY\s+)?STAGE\s+(IF\s+NOT\s+EXISTS\s+)?(?P<stage>\S+).*$", LocalSession._create_stage),
+    (r"COPY\s+FILES\s+INTO\s+(?P<target>@\S+)\s+FROM\s+(?P<source>@\S+)\s+FILES\s*=\s*\((?P<files>.*)\)$",
+     LocalSession._copy_files),
+    (rf"REMOVE\s+{_LOCATION}(\s+PATTERN\s*=\s*'(?P<pattern>(?:[^']|'')*)')?$", LocalSession._remove),
+    (r"SELECT\s+\*\s+FROM\s+TABLE\s*\(\s*RESULT_SCAN\s*\(\s*LAST_QUERY_ID\s*\(\s*\)\s*\)\s*\)$", LocalSession._result_scan),
+    (r"SHOW\s+COLUMNS\s+IN\s+(TABLE\s+)?(?P<table>\S+)$", LocalSession._show_columns),
+    (r"EXECUTE\s+IMMEDIATE\s+\$\$(?P<body>.*)\$\$$", LocalSession._execute_block),
+    (r"COPY\s+INTO\s+(?P<table>\S+)\s*\((?P<columns>[^)]*)\)\s*FROM\s*\(\s*"
+     r"SELECT\s+\$1:(?P<table_column>\w+)::VARCHAR\s*,\s*OBJECT_DELETE\(\$1,\s*'\w+'\)\s*,\s*"
+     r"'(?P<filename>(?:[^']|'')*)'\s*,\s*'(?P<timestamp>(?:[^']|'')*)'::TIMESTAMP_NTZ\s+"
+     r"FROM\s+(?P<location>@\S+)\s*\)\s*FILE_FORMAT\s*=\s*\(\s*TYPE\s*=\s*PARQUET\s*\)"
+     r"(?P<purge>\s+PURGE\s*=\s*TRUE)?$", LocalSession._copy_into_table),
+]]
+
+
+def create_local_session(config: Dict[str, Any]) -> LocalSession:
+    """
+    Creates the offline session from the [snowflake] section of the configuration:
+    local_root (default "./local_snowflake"), local_latency_ms and
+    local_bandwidth_mbps.  The configured stages are created if missing.
+    """
+    session = LocalSession(config.get("local_root", "./local_snowflake"), config.get("local_latency_ms", 0),
+                           config.get("local_bandwidth_mbps", 0))
+    for key in ("raw_stage", "processing_stage", "complete_stage", "error_stage"):
+        if config.get(key):
+            os.makedirs(session._stage_dir(config[key]), exist_ok=True)
+    logger.info(f"Using the local Snowflake stand-in in {session.root_dir} "
+                f"({config.get('local_latency_ms', 0)} ms per round trip).")
+    return session
@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryGovernor:
+    """
+    Tracks the bytes of extracted data the container holds, across all file workers,
+    against a budget.  Loaders reserve the bytes of every batch they keep and release
+    them once the batch is uploaded or spilled to disk.  RAM downloads are capped
+    separately (memory_download_total_mb): a file's own download must not keep its
+    extraction waiting for memory only its processing would free.
+
+    A reservation that does not fit waits for releases (backpressure), at most
+    wait_seconds when the caller passes that as its timeout.  A single reservation
+    larger than the whole budget is granted once nothing else is held, so oversized
+    batches slow things down but never deadlock.
+    """
+
+    def __init__(self, budget_bytes: int, wait_seconds: float = 30.0):
+        self.budget = budget_bytes
+        self.wait_seconds = wait_seconds
+        self.used = 0
+        self.peak = 0
+        self.condition = threading.Condition()
+
+    def try_acquire(self, nbytes: int) -> bool:
+        """
+        Reserves nbytes if they fit in the budget now.
+        """
+        with self.condition:
+            return self._grant(nbytes)
+
+    def acquire(self, nbytes: int, timeout: Optional[float] = None) -> bool:
+        """
+        Reserves nbytes, waiting up to timeout seconds (forever if None) for them to fit.
+
+        Returns:
+            bool: True if the bytes were reserved, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self._grant(nbytes):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def release(self, nbytes: int) -> None:
+        with self.condition:
+            self.used = max(0, self.used - nbytes)
+            self.condition.notify_all()
+
+    def _grant(self, nbytes: int) -> bool:
+        if self.used + nbytes > self.budget and self.used > 0:
+            return False
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+        return True
+
+
+_governor: Optional[MemoryGovernor] = None
+
+
+def configure(config: Dict[str, Any]) -> Optional[MemoryGovernor]:
+    """
+    Sets up the process-wide governor from memory_budget_mb (0, the default, turns it
+    off) and memory_wait_seconds (default 30).  Keeps the current governor if the
+    settings are unchanged.
+    """
+    global _governor
+    budget = int(config.get("memory_budget_mb", 0) * 1024 * 1024)
+    wait_seconds = config.get("memory_wait_seconds", 30)
+    if budget <= 0:
+        _governor = None
+    elif _governor is None or _governor.budget != budget or _governor.wait_seconds != wait_seconds:
+        _governor = MemoryGovernor(budget, wait_seconds)
+        logger.info(f"Memory budget for extracted data: {budget / 2**20:.0f} MB")
+    return _governor
+
+
+def get_governor() -> Optional[MemoryGovernor]:
+    """
+    Returns the process-wide governor, or None if there is no memory budget.
+    """
+    return _governor
+
+
+def spill(obj: Any, spill_dir: str) -> str:
+    """
+    Writes obj (a chunk of batches) to a gzip-compressed pickle in spill_dir.
+
+    Returns:
+        str: The path to pass to unspill.
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    path = os.path.join(spill_dir, f"spill_{uuid.uuid4().hex}.pkl.gz")
+    # Level 1: spilling must be cheaper than the upload it waits for
+    pd.to_pickle(obj, path, compression={"method": "gzip", "compresslevel": 1})
+    return path
+
+
+def unspill(path: str) -> Any:
+    """
+    Reads back and deletes a file written by spill.
+    """
+    try:
+        return pd.read_pickle(path, compression="gzip")
+    finally:
+        os.remove(path)
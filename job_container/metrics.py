@@ -0,0 +1,215 @@
+import contextlib
+import contextvars
+import datetime
+import itertools
+import json
+import logging
+import resource
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import pandas as pd
+from snowflake.snowpark import Session
+
+logger = logging.getLogger(__name__)
+
+# The run being measured and the file being processed by the current thread or task.
+# Thread pools do not inherit it; wrap their targets with bind().
+_current = contextvars.ContextVar("msaccess_metrics", default=(None, None))
+
+METRICS_COLUMNS = ["RUN_ID", "FILENAME", "TABLE_NAME", "PHASE", "STARTED_AT", "SECONDS", "ROWS", "BYTES", "PEAK_RSS_MB"]
+
+
+class RunMetrics:
+    """
+    Collects one record per phase (download, mdb-tables, mdb-export, extract, load,
+    upload, commit, move, file, ...) of every file and table of a run, with its wall
+    time, rows, bytes and the peak RSS of the process while the phase ran (see
+    _PeakTracker).
+    """
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.records: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self.lock:
+            self.records.append(record)
+
+    def emit(self) -> None:
+        """
+        Logs every record as one JSON line.
+        """
+        for record in self.records:
+            logger.info(json.dumps(record, default=str))
+
+    def write(self, session: Session, table_name: str) -> None:
+        """
+        Appends the records to the run metrics table, creating it if needed.
+        """
+        if not self.records:
+            return
+        session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                RUN_ID VARCHAR, FILENAME VARCHAR, TABLE_NAME VARCHAR, PHASE VARCHAR, STARTED_AT TIMESTAMP_NTZ,
+                SECONDS FLOAT, "ROWS" NUMBER, BYTES NUMBER, PEAK_RSS_MB FLOAT
+            )
+        """).collect()
+        frame = pd.DataFrame(self.records).rename(columns=str.upper).rename(columns={"TABLE": "TABLE_NAME"})
+        session.write_pandas(frame[METRICS_COLUMNS], table_name, use_logical_type=True)
+
+
+@contextlib.contextmanager
+def collect(run: RunMetrics) -> Iterator[RunMetrics]:
+    """
+    Makes run the destination of the phases recorded in the with block.
+    """
+    token = _current.set((run, None))
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def file(filename: str) -> Iterator[None]:
+    """
+    Attributes the phases recorded in the with block to filename.
+    """
+    run, _ = _current.get()
+    token = _current.set((run, filename))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class _PeakTracker:
+    """
+    Peak RSS per phase from the kernel's high-water mark (VmHWM), which is process
+    wide and only resettable as a whole (writing 5 to /proc/self/clear_refs).  Phases
+    overlap across threads, so every time a phase starts or ends the high-water mark
+    since the last reset is credited to all phases running at that moment, then reset.
+    Each phase thus gets the peak of exactly the time it ran.
+
+    Where the mark cannot be reset (not Linux), the lifetime peak ru_maxrss is used.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = itertools.count()
+        self.active: Dict[int, float] = {}
+        self.resettable = True
+
+    def start(self) -> int:
+        with self.lock:
+            self._fold()
+            token = next(self.tokens)
+            self.active[token] = 0.0
+            return token
+
+    def stop(self, token: int) -> float:
+        with self.lock:
+            self._fold()
+            return self.active.pop(token)
+
+    def _fold(self) -> None:
+        peak = _high_water_mark_mb()
+        for token in self.active:
+            self.active[token] = max(self.active[token], peak)
+        if self.resettable:
+            try:
+                with open("/proc/self/clear_refs", "w") as f:
+                    f.write("5")
+            except OSError:
+                self.resettable = False
+
+
+def _status_mb(field: str) -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _high_water_mark_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return _status_mb("VmHWM") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+_peaks = _PeakTracker()
+
+
+def record(phase_name: str, seconds: float, table: Optional[str] = None, rows: int = 0, nbytes: int = 0,
+           started_at: Optional[datetime.datetime] = None, peak_rss_mb: Optional[float] = None) -> None:
+    """
+    Records a phase measured by the caller.  Without peak_rss_mb, the current RSS is
+    recorded, as the caller did not track the peak.  Does nothing outside collect().
+    """
+    run, filename = _current.get()
+    if run is None:
+        return
+    if peak_rss_mb is None:
+        peak_rss_mb = _status_mb("VmRSS") or _high_water_mark_mb()
+    run.add({
+        "run_id": run.run_id,
+        "filename": filename,
+        "table": table,
+        "phase": phase_name,
+        "started_at": started_at or datetime.datetime.now() - datetime.timedelta(seconds=seconds),
+        "seconds": seconds,
+        "rows": rows,
+        "bytes": nbytes,
+        "peak_rss_mb": peak_rss_mb,
+    })
+
+
+@contextlib.contextmanager
+def phase(phase_name: str, table: Optional[str] = None, rows: int = 0, nbytes: int = 0) -> Iterator[Dict[str, int]]:
+    """
+    Times the with block as one phase.  The yielded dict's "rows" and "bytes" can be
+    filled in by the block; the phase is recorded even if the block raises.
+    """
+    counts = {"rows": rows, "bytes": nbytes}
+    if _current.get()[0] is None:
+        yield counts
+        return
+    started_at = datetime.datetime.now()
+    start = time.monotonic()
+    token = _peaks.start()
+    try:
+        yield counts
+    finally:
+        peak = _peaks.stop(token)
+        record(phase_name, time.monotonic() - start, table, counts["rows"], counts["bytes"], started_at, peak)
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    Returns fn bound to a copy of the caller's metrics context, for running on another
+    thread.  Bind once per submitted call: a context can only be entered by one thread
+    at a time.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def publish(run: RunMetrics, session: Session, config: Dict[str, Any]) -> None:
+    """
+    Emits the records of a run as JSON log lines and appends them to the table named
+    by run_metrics_table ("" to only log them).  Never raises.
+    """
+    run.emit()
+    table_name = config.get("run_metrics_table", "MSACCESS_RUN_METRICS")
+    if not table_name:
+        return
+    try:
+        run.write(session, table_name)
+    except Exception as e:
+        logger.warning(f"Could not write the run metrics to {table_name}: {e}")
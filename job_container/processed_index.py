@@ -0,0 +1,122 @@
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional
+from snowflake.snowpark import Session
+from loaders import sql_string
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessedFilesIndex:
+    """
+    Persistent index of the Access files already ingested, keyed by the md5 content
+    hash that LIST reports for every staged file, so the same database uploaded again
+    under another name is recognised before it is moved or downloaded.
+
+    The index lives in a Snowflake table; lookups are answered from a local JSON cache
+    first and only the hashes missing from it are queried, in one statement per call.
+    """
+
+    def __init__(self, session: Session, table_name: str = "MSACCESS_PROCESSED_FILES", cache_path: Optional[str] = None):
+        """
+        Initializes the index, creating its table if it does not exist.
+
+        Args:
+            session (Session): The Snowpark session to use.
+            table_name (str, optional): The index table. Defaults to "MSACCESS_PROCESSED_FILES".
+            cache_path (str, optional): The local JSON cache.  Defaults to a file in the
+                temporary directory.
+        """
+        self.session = session
+        self.table_name = table_name
+        self.cache_path = cache_path or os.path.join(tempfile.gettempdir(), "msaccess_processed_files.json")
+        self.lock = threading.Lock()
+        self.cache = self._load_cache()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (
+                MD5 VARCHAR, FILENAME VARCHAR, ROWS_LOADED NUMBER, LOADED_AT TIMESTAMP_NTZ, DUPLICATE_OF VARCHAR
+            )
+        """).collect()
+
+    def _load_cache(self) -> Dict[str, dict]:
+        try:
+            with open(self.cache_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self) -> None:
+        try:
+            with open(self.cache_path, "w") as f:
+                json.dump(self.cache, f)
+        except OSError as e:
+            logger.warning(f"Could not save the processed files cache to {self.cache_path}: {e}")
+
+    def lookup(self, md5s: List[str]) -> Dict[str, dict]:
+        """
+        Finds the earlier loads of the given content hashes.
+
+        Args:
+            md5s (List[str]): The md5 hashes from the stage listing.
+
+        Returns:
+            Dict[str, dict]: For each hash that was already loaded, the original load as
+                {"filename", "rows", "loaded_at"}.
+        """
+        md5s = [md5 for md5 in set(md5s) if md5]
+        with self.lock:
+            missing = [md5 for md5 in md5s if md5 not in self.cache]
+        if missing:
+            rows = self.session.sql(f"""
+                SELECT MD5, FILENAME, ROWS_LOADED, LOADED_AT FROM {self.table_name}
+                WHERE DUPLICATE_OF IS NULL AND MD5 IN ({", ".join(sql_string(md5) for md5 in missing)})
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY MD5 ORDER BY LOADED_AT) = 1
+            """).collect()
+            with self.lock:
+                for row in rows:
+                    self.cache[row["MD5"]] = {"filename": row["FILENAME"], "rows": row["ROWS_LOADED"],
+                                              "loaded_at": str(row["LOADED_AT"])}
+                if rows:
+                    self._save_cache()
+        with self.lock:
+            return {md5: self.cache[md5] for md5 in md5s if md5 in self.cache}
+
+    def record(self, md5: str, filename: str, rows: int = 0, duplicate_of: Optional[str] = None) -> None:
+        """
+        Records a loaded file, or a file skipped as a duplicate of duplicate_of.
+        """
+        if not md5:
+            return
+        now = datetime.datetime.now()
+        self.session.sql(f"""
+            INSERT INTO {self.table_name} (MD5, FILENAME, ROWS_LOADED, LOADED_AT, DUPLICATE_OF)
+            VALUES ({sql_string(md5)}, {sql_string(filename)}, {int(rows)},
+                    {sql_string(now.strftime('%Y-%m-%d %H:%M:%S.%f'))}::TIMESTAMP_NTZ,
+                    {sql_string(duplicate_of) if duplicate_of else "NULL"})
+        """).collect()
+        if duplicate_of is None:
+            with self.lock:
+                self.cache.setdefault(md5, {"filename": filename, "rows": rows, "loaded_at": str(now)})
+                self._save_cache()
+
+
+def create_index(session: Session, config: Dict) -> Optional[ProcessedFilesIndex]:
+    """
+    Creates the processed files index if the configuration enables dedupe.
+
+    Args:
+        session (Session): The Snowpark session to use.
+        config (dict): The [snowflake] section of the configuration file; reads dedupe,
+            processed_files_table and processed_files_cache.
+
+    Returns:
+        Optional[ProcessedFilesIndex]: The index, or None if dedupe is off.
+    """
+    if not config.get("dedupe", False):
+        return None
+    return ProcessedFilesIndex(session, config.get("processed_files_table", "MSACCESS_PROCESSED_FILES"),
+                               config.get("processed_files_cache"))
@@ -0,0 +1,170 @@
+import contextlib
+import cProfile
+import datetime
+import io
+import logging
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import tracemalloc
+from typing import Any, Dict, Iterator, Optional
+from snowflake.snowpark import Session
+
+logger = logging.getLogger(__name__)
+
+# Set to 1/true/yes to profile without changing the configuration
+PROFILE_ENV = "MSACCESS_PROFILE"
+
+# cProfile and tracemalloc hook into the interpreter, so one file is profiled at a time
+_profiler_lock = threading.Lock()
+
+
+def profiling_enabled(config: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Returns whether profiling is on, from the MSACCESS_PROFILE environment variable or
+    the profile setting of the configuration.
+    """
+    if os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes"):
+        return True
+    return bool((config or {}).get("profile", False))
+
+
+class FileProfiler:
+    """
+    Profiles the processing of one Access file with cProfile and, unless
+    profile_memory is off, tracemalloc.  Each table gets a profile and an allocation
+    report of its own (see table()); the file profile adds them up.  On exit the
+    results are PUT to @<profile_stage>/<filename>_<timestamp>/:
+
+        <file>.prof, <file>.txt                 cProfile stats of the whole file
+        <file>.tracemalloc, <file>_memory.txt   allocation snapshot and top allocations
+        table_<name>.prof / .txt / _memory.txt  the same per table
+
+    The .prof files load with pstats or snakeviz; snapshots with
+    tracemalloc.Snapshot.load.  Only the calling thread is profiled: background
+    uploads and mdb-export subprocesses show up as waiting time.
+    """
+
+    def __init__(self, session: Session, filename: str, config: Dict[str, Any]):
+        self.session = session
+        self.filename = filename
+        self.stage = config.get("profile_stage", "DIAGNOSTICS")
+        self.trace_memory = config.get("profile_memory", True)
+        self.trace_frames = config.get("profile_trace_frames", 10)
+        self.top = config.get("profile_top", 50)
+        self.name = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', filename)}_{datetime.datetime.now():%Y%m%d_%H%M%S}"
+        self.output_dir = tempfile.mkdtemp(prefix="msaccess_profile_")
+        self.profiler = cProfile.Profile()
+        self.table_profiles = []
+        self.started_tracemalloc = False
+
+    def __enter__(self) -> "FileProfiler":
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self.started_tracemalloc = True
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.profiler.disable()
+        try:
+            stats = pstats.Stats(self.profiler)
+            for profile in self.table_profiles:
+                stats.add(profile)
+            self._write_stats(stats, self.name)
+            if self.trace_memory and tracemalloc.is_tracing():
+                snapshot = _snapshot()
+                snapshot.dump(os.path.join(self.output_dir, f"{self.name}.tracemalloc"))
+                self._write_text(f"{self.name}_memory.txt", _top_allocations(snapshot.statistics("lineno"), self.top))
+            self._upload()
+        except Exception as e:
+            logger.warning(f"Could not save the profile of '{self.filename}': {e}")
+        finally:
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    @contextlib.contextmanager
+    def table(self, table_name: str) -> Iterator[None]:
+        """
+        Profiles one table separately: the file profiler is paused while the table's
+        own profiler runs, and the allocations made during the table are reported as
+        the difference between snapshots taken before and after it.
+        """
+        before = _snapshot() if self.trace_memory and tracemalloc.is_tracing() else None
+        self.profiler.disable()
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.profiler.enable()
+            self.table_profiles.append(profile)
+            try:
+                name = f"table_{re.sub(r'[^A-Za-z0-9_.-]', '_', table_name)}"
+                self._write_stats(pstats.Stats(profile), name)
+                if before is not None:
+                    growth = _snapshot().compare_to(before, "lineno")
+                    self._write_text(f"{name}_memory.txt", _top_allocations(growth, self.top))
+            except Exception as e:
+                logger.warning(f"Could not save the profile of table '{table_name}': {e}")
+
+    def _write_stats(self, stats: pstats.Stats, name: str) -> None:
+        stats.dump_stats(os.path.join(self.output_dir, f"{name}.prof"))
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(self.top)
+        self._write_text(f"{name}.txt", text.getvalue())
+
+    def _write_text(self, name: str, text: str) -> None:
+        with open(os.path.join(self.output_dir, name), "w") as f:
+            f.write(text)
+
+    def _upload(self) -> None:
+        self.session.sql(f"CREATE STAGE IF NOT EXISTS {self.stage}").collect()
+        self.session.file.put(os.path.join(self.output_dir, "*"), f"@{self.stage}/{self.name}/",
+                              auto_compress=False, overwrite=True)
+        logger.info(f"Saved the profile of '{self.filename}' to @{self.stage}/{self.name}/")
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    # Leave out the allocations of the profilers themselves
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, pstats.__file__),
+    ])
+
+
+def _top_allocations(statistics, top: int) -> str:
+    return "\n".join(str(stat) for stat in statistics[:top]) + "\n"
+
+
+@contextlib.contextmanager
+def profile_file(session: Session, filename: str, config: Optional[Dict[str, Any]] = None) -> Iterator[Optional[FileProfiler]]:
+    """
+    Profiles the with block as the processing of filename if profiling is enabled,
+    yielding the FileProfiler, or None when profiling is off or another file is being
+    profiled.  Use file_workers = 1 to profile every file.
+    """
+    if not profiling_enabled(config) or not _profiler_lock.acquire(blocking=False):
+        if profiling_enabled(config):
+            logger.info(f"Not profiling '{filename}': another file is being profiled.")
+        yield None
+        return
+    try:
+        with FileProfiler(session, filename, config or {}) as profiler:
+            yield profiler
+    finally:
+        _profiler_lock.release()
+
+
+def profile_table(profiler: Optional[FileProfiler], table_name: str):
+    """
+    Profiles one table of a profiled file; does nothing if profiler is None.
+    """
+    return profiler.table(table_name) if profiler is not None else contextlib.nullcontext()
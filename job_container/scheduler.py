@@ -0,0 +1,516 @@
+import contextlib
+import heapq
+import itertools
+import logging
+import queue
+import shutil
+import threading
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from snowflake.snowpark import Session
+from loaders import logical_database_name
+import memory_governor
+import metrics
+import utils
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_session(session: Session, pool=None):
+    """
+    The session a file worker uses: one checked out of the pool if there is one,
+    otherwise the shared session.
+    """
+    return pool.session() if pool is not None else contextlib.nullcontext(session)
+
+
+# Held while a file of a logical database is loaded in load_mode "incremental"
+_database_locks: Dict[str, threading.Lock] = {}
+_database_locks_lock = threading.Lock()
+
+
+def _database_lock(database: str) -> threading.Lock:
+    with _database_locks_lock:
+        return _database_locks.setdefault(database, threading.Lock())
+
+
+class DatabaseTurns:
+    """
+    Processes the files of each logical database one at a time, in the order given,
+    for load_mode "incremental": every upload is compared with the row hashes the
+    previous one stored, so a later upload must not load before (or while) an
+    earlier one does.  Files are handed to the workers in the same order, so the file
+    a worker waits for has always been taken by another worker already.
+    """
+
+    def __init__(self, filenames: List[str], name_pattern: Optional[str] = None):
+        self.condition = threading.Condition()
+        self.databases = {filename: logical_database_name(filename, name_pattern) for filename in filenames}
+        self.queues: Dict[str, deque] = {}
+        for filename in filenames:
+            self.queues.setdefault(self.databases[filename], deque()).append(filename)
+
+    @contextlib.contextmanager
+    def turn(self, filename: str):
+        """
+        Waits until the earlier files of filename's database are done, then holds the
+        database's lock for the with block.
+        """
+        database = self.databases[filename]
+        with self.condition:
+            self.condition.wait_for(lambda: self.queues[database][0] == filename)
+        try:
+            with _database_lock(database):
+                yield
+        finally:
+            with self.condition:
+                self.queues[database].popleft()
+                self.condition.notify_all()
+
+
+def _turn(turns: Optional[DatabaseTurns], filename: str):
+    return turns.turn(filename) if turns is not None else contextlib.nullcontext()
+
+
+class FinishedFiles:
+    """
+    Moves the files of a batch from the processing stage to the complete or error
+    stage as they finish, in bulk groups of up to group_size files or whatever
+    finished within group_seconds.  A run that is killed part way then leaves only the
+    files still being processed and the last group on the processing stage, instead
+    of every file claimed for the batch.
+    """
+
+    def __init__(self, session: Session, stages: Dict[str, str], group_size: int = 10,
+                 group_seconds: float = 30.0):
+        self.session = session
+        self.stages = stages
+        self.group_size = max(1, group_size)
+        self.group_seconds = group_seconds
+        self.lock = threading.Lock()
+        self.pending = {"complete": [], "error": []}
+        self.first_pending = None
+
+    def add(self, filename: str, result: Optional[Dict[str, int]]) -> None:
+        """
+        Records a finished file (result None if it failed) and moves the pending group
+        once it is full or old enough.  Never raises.
+        """
+        with self.lock:
+            self.pending["complete" if result else "error"].append(filename)
+            self.first_pending = self.first_pending or time.monotonic()
+            if sum(map(len, self.pending.values())) < self.group_size and \
+                    time.monotonic() - self.first_pending < self.group_seconds:
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Moves all pending files.  Never raises.
+        """
+        with self.lock:
+            groups = self.pending
+            self.pending = {"complete": [], "error": []}
+            self.first_pending = None
+        for stage, filenames in groups.items():
+            try:
+                utils.move_staged_files(self.session, filenames, self.stages["processing"], self.stages[stage])
+            except Exception as e:
+                logger.error(f"Could not move {len(filenames)} files to the {stage} stage: {e}")
+
+
+def process_claimed_file(session: Session, filename: str, stages: Dict[str, str], config: Dict[str, Any],
+                         file_size: Optional[int] = None) -> Optional[Dict[str, int]]:
+    """
+    Extracts and loads one Access file that is already on the processing stage.  Each
+    call uses its own scratch directory, and a failure never propagates to the other
+    files of the batch.
+
+    Args:
+        session: The Snowpark session to use.
+        filename: The name of the file on the processing stage.
+        stages: The stage names, keyed by "raw", "processing", "complete" and "error".
+        config: The [snowflake] section of the configuration file.
+        file_size: The size of the file in bytes, if known.
+
+    Returns:
+        dict: The number of rows loaded per Access table, or None if the file failed.
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="msaccess_file_")
+    try:
+        return utils.process_file(session, filename, stages["processing"], config, scratch_dir, file_size)
+    except Exception as e:
+        logger.error(f"Unexpected error processing '{filename}': {e}")
+        return None
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def _prefetch_files(session: Session, filenames: List[str], stages: Dict[str, str], config: Dict[str, Any],
+                    sizes: Dict[str, int], ready: queue.Queue, consumers: int) -> None:
+    """
+    Producer of the prefetch pipeline: downloads the claimed files in order and puts
+    (filename, scratch_dir, local path or None) on the ready queue.  The queue is
+    bounded, so at most prefetch_depth downloaded files wait for a worker.  Ends with
+    one None per consumer.
+    """
+    for filename in filenames:
+        scratch_dir = tempfile.mkdtemp(prefix="msaccess_file_")
+        try:
+            with metrics.file(filename):
+                # Prefetched files go to disk: in RAM they would hold memory while waiting in the queue
+                fullpath = utils.fetch_staged_file(session, stages["processing"], filename, scratch_dir,
+                                                   dict(config, memory_download_mb=0), sizes.get(filename))
+        except Exception as e:
+            logger.error(f"Error downloading '{filename}': {e}")
+            fullpath = None
+        ready.put((filename, scratch_dir, fullpath))
+    for _ in range(consumers):
+        ready.put(None)
+
+
+def _process_prefetched_files(session: Session, config: Dict[str, Any], ready: queue.Queue,
+                              results: Dict[str, Optional[Dict[str, int]]], durations: Dict[str, float],
+                              pool=None, turns: Optional[DatabaseTurns] = None,
+                              finished: Optional[FinishedFiles] = None) -> None:
+    """
+    Consumer of the prefetch pipeline: extracts and loads downloaded files until it
+    takes None from the ready queue, recording the processing time of each and
+    handing it to finished.  Never raises.
+    """
+    while True:
+        item = ready.get()
+        if item is None:
+            return
+        filename, scratch_dir, fullpath = item
+        with _turn(turns, filename):
+            start = time.monotonic()
+            _process_prefetched_file(session, config, filename, scratch_dir, fullpath, results, pool)
+            durations[filename] = time.monotonic() - start
+        if finished is not None:
+            finished.add(filename, results[filename])
+
+
+def _process_prefetched_file(session: Session, config: Dict[str, Any], filename: str, scratch_dir: str,
+                             fullpath: Optional[str], results: Dict[str, Optional[Dict[str, int]]], pool=None) -> None:
+    """
+    Extracts and loads one prefetched file (fullpath None if its download failed) and
+    removes its local copy.  Never raises.
+    """
+    try:
+        if fullpath:
+            with _worker_session(session, pool) as worker_session, metrics.file(filename), \
+                    metrics.phase("file") as counts:
+                results[filename] = utils.process_local_file(worker_session, filename, fullpath, scratch_dir, config)
+                counts["rows"] = sum((results[filename] or {}).values())
+        else:
+            results[filename] = None
+    except Exception as e:
+        logger.error(f"Unexpected error processing '{filename}': {e}")
+        results[filename] = None
+    finally:
+        if fullpath:
+            utils.remove_fetched_file(fullpath, scratch_dir)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def _run_pipeline(session: Session, filenames: List[str], stages: Dict[str, str], config: Dict[str, Any],
+                  sizes: Dict[str, int], max_workers: int, prefetch_depth: int,
+                  durations: Dict[str, float], pool=None, turns: Optional[DatabaseTurns] = None,
+                  finished: Optional[FinishedFiles] = None) -> List[Optional[Dict[str, int]]]:
+    """
+    Processes claimed files with one download thread feeding max_workers processing
+    threads through a queue of prefetch_depth files, so the next files download while
+    the current ones are extracted and loaded and network and CPU time overlap.
+
+    Returns:
+        list: The result of each file, in the order of filenames.
+    """
+    ready = queue.Queue(maxsize=prefetch_depth)
+    results = {}
+    producer = threading.Thread(target=metrics.bind(_prefetch_files), name="prefetch",
+                                args=(session, filenames, stages, config, sizes, ready, max_workers))
+    consumers = [threading.Thread(target=metrics.bind(_process_prefetched_files), name=f"file-worker-{i}",
+                                  args=(session, config, ready, results, durations, pool, turns, finished))
+                 for i in range(max_workers)]
+    producer.start()
+    for consumer in consumers:
+        consumer.start()
+    producer.join()
+    for consumer in consumers:
+        consumer.join()
+    return [results.get(filename) for filename in filenames]
+
+
+def lpt_order(filenames: List[str], sizes: Dict[str, int]) -> List[str]:
+    """
+    Orders files largest first (longest processing time first).  Workers take the next
+    file as soon as they are free, so this greedily packs the small files around the
+    large ones and no worker picks up a large file at the end of the batch.  Files of
+    unknown size go last.
+    """
+    return sorted(filenames, key=lambda filename: sizes.get(filename) or 0, reverse=True)
+
+
+def incremental_order(filenames: List[str], sizes: Dict[str, int], uploaded: Dict[str, float],
+                      name_pattern: Optional[str] = None) -> List[str]:
+    """
+    Orders files for load_mode "incremental": the uploads of each logical database
+    in upload order (uploaded timestamp, then name), with the databases interleaved
+    largest first, so consecutive files mostly belong to different databases and
+    DatabaseTurns rarely keeps a worker waiting.
+    """
+    databases: Dict[str, List[str]] = {}
+    for filename in filenames:
+        databases.setdefault(logical_database_name(filename, name_pattern), []).append(filename)
+    for uploads in databases.values():
+        uploads.sort(key=lambda filename: (uploaded.get(filename, 0.0), filename))
+    largest_first = sorted(databases.values(), key=lambda uploads: sum(sizes.get(f) or 0 for f in uploads), reverse=True)
+    return [filename for files in itertools.zip_longest(*largest_first) for filename in files if filename is not None]
+
+
+def plan_makespan(loads: List[float], workers: int) -> Tuple[float, float]:
+    """
+    Packs loads (file sizes or durations) onto workers with the LPT rule.
+
+    Returns:
+        tuple: The makespan of the LPT schedule (the load of the busiest worker) and the
+            lower bound no schedule can beat, max(total / workers, largest load).  LPT
+            stays within 4/3 of the optimum.
+    """
+    if not loads:
+        return 0.0, 0.0
+    workers = min(workers, len(loads))
+    heap = [0.0] * workers
+    for load in sorted(loads, reverse=True):
+        heapq.heappush(heap, heapq.heappop(heap) + load)
+    return max(heap), max(sum(loads) / workers, max(loads))
+
+
+def run_batch(session: Session, filenames: List[str], stages: Dict[str, str], config: Dict[str, Any],
+              sizes: Optional[Dict[str, int]] = None, pool=None,
+              uploaded: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Processes a batch of staged Access files: claims them all by moving them from the
+    raw stage to the processing stage in bulk, extracts and loads the claimed files
+    with a pool of file_workers threads (from the configuration, defaults to 1), moves
+    them to the complete or error stage in bulk groups as they finish (move_group_size
+    files, or after move_group_seconds; see FinishedFiles) and logs the throughput.
+    With prefetch_depth > 0 a download thread keeps up to prefetch_depth files
+    downloaded ahead of the workers (see _run_pipeline).
+    With schedule = "lpt" (the default) the files are processed largest first (see
+    lpt_order), and the summary reports the makespan against the lower bound of the
+    measured file times; "listing" keeps the order of filenames.
+    With load_mode = "incremental" the uploads of each logical database are processed
+    one at a time in upload order instead (see incremental_order and DatabaseTurns).
+    Without a pool the threads share the Snowpark session, which is thread-safe for the
+    queries and file transfers used here; with a session_pool.SessionPool each file is
+    processed on a session of its own.  The CPU-heavy work runs in mdb-export
+    subprocesses.
+
+    Args:
+        session: The Snowpark session to use.
+        filenames: The names of the files on the raw stage.
+        stages: The stage names, keyed by "raw", "processing", "complete" and "error".
+        config: The [snowflake] section of the configuration file.
+        sizes: The size of each file in bytes, from the stage listing, if known.
+        pool: The session_pool.SessionPool for the file workers, or None.
+        uploaded: The upload time (POSIX timestamp) of each file, from the stage
+            listing, if known.
+
+    Returns:
+        dict: A summary of the batch with the per-file results under "files".  Files
+            that could not be claimed are left on the raw stage and are not listed.
+    """
+    claimed = utils.move_staged_files(session, filenames, stages["raw"], stages["processing"])
+    skipped = [name for name in filenames if not claimed[name]]
+    if skipped:
+        logger.error(f"Could not move {len(skipped)} files to the processing stage, skipping them: {skipped}")
+    filenames = [name for name in filenames if claimed[name]]
+    sizes = sizes or {}
+
+    max_workers = max(1, config.get("file_workers", 1))
+    turns = None
+    if config.get("load_mode") == "incremental":
+        name_pattern = config.get("incremental_name_pattern")
+        filenames = incremental_order(filenames, sizes, uploaded or {}, name_pattern)
+        turns = DatabaseTurns(filenames, name_pattern)
+    elif config.get("schedule", "lpt") == "lpt":
+        filenames = lpt_order(filenames, sizes)
+        planned, bound = plan_makespan([sizes.get(name) or 0 for name in filenames], max_workers)
+        logger.info(f"LPT schedule of {len(filenames)} files on {max_workers} workers: busiest worker gets "
+                    f"{planned / 2**20:.1f} MB, lower bound {bound / 2**20:.1f} MB")
+    durations = {}
+    finished = FinishedFiles(session, stages, config.get("move_group_size", 10), config.get("move_group_seconds", 30))
+
+    def process(filename):
+        with _turn(turns, filename):
+            file_start = time.monotonic()
+            try:
+                with contextlib.ExitStack() as stack:
+                    try:
+                        worker_session = stack.enter_context(_worker_session(session, pool))
+                    except Exception as e:
+                        logger.error(f"Could not get a session for '{filename}': {e}")
+                        return None
+                    with metrics.file(filename), metrics.phase("file", nbytes=sizes.get(filename) or 0) as counts:
+                        result = process_claimed_file(worker_session, filename, stages, config, sizes.get(filename))
+                        counts["rows"] = sum((result or {}).values())
+                        return result
+            except Exception as e:
+                logger.error(f"Unexpected error processing '{filename}': {e}")
+                return None
+            finally:
+                durations[filename] = time.monotonic() - file_start
+
+    def process_and_move(filename):
+        result = process(filename)
+        finished.add(filename, result)
+        return result
+
+    start = time.monotonic()
+    prefetch_depth = config.get("prefetch_depth", 0)
+    if prefetch_depth > 0:
+        results = _run_pipeline(session, filenames, stages, config, sizes, max_workers, prefetch_depth, durations,
+                                pool, turns, finished)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="file-worker") as executor:
+            results = [future.result() for future in [executor.submit(metrics.bind(process_and_move), filename)
+                                                       for filename in filenames]]
+    finished.flush()
+    elapsed = max(time.monotonic() - start, 1e-9)
+    # How close the run came to the best possible schedule of the measured file times
+    _, makespan_bound = plan_makespan(list(durations.values()), max_workers)
+
+    completed = [name for name, r in zip(filenames, results) if r]
+    failed = [name for name, r in zip(filenames, results) if not r]
+    for name in failed:
+        # Lets the run metrics give an error rate (files with an error record per file)
+        with metrics.file(name):
+            metrics.record("error", 0.0)
+
+    rows = sum(sum(r.values()) for r in results if r)
+    summary = {
+        "files": dict(zip(filenames, results)),
+        "complete": len(completed),
+        "error": len(failed),
+        "rows": rows,
+        "seconds": elapsed,
+        "makespan": elapsed,
+        "makespan_lower_bound": makespan_bound,
+        "file_seconds": durations,
+    }
+    logger.info(f"Processed {len(filenames)} files with {max_workers} workers in {elapsed:.1f}s "
+                f"({len(completed)} complete, {len(failed)} error): "
+                f"{len(filenames) / elapsed:.2f} files/s, {rows / elapsed:.0f} rows/s")
+    logger.info(f"Makespan {elapsed:.1f}s, lower bound {makespan_bound:.1f}s "
+                f"(schedule efficiency at least {makespan_bound / elapsed:.0%})")
+    return summary
+
+
+def skip_duplicates(session: Session, files_list: List[dict], stages: Dict[str, str], index) -> List[dict]:
+    """
+    Moves files whose content was already ingested straight from the raw stage to the
+    complete stage, without downloading them, and records which earlier load each one
+    matches.  Of several files with the same content in one listing only the first is
+    kept; the others stay on the raw stage and are caught as duplicates next run.
+
+    Args:
+        session: The Snowpark session to use.
+        files_list: The raw stage listing from utils.list_files_in_stage.
+        stages: The stage names, keyed by "raw", "processing", "complete" and "error".
+        index: The processed_index.ProcessedFilesIndex to check.
+
+    Returns:
+        list: The entries of files_list that still need processing.
+    """
+    loaded = index.lookup([f.get("md5") for f in files_list])
+    duplicates = {}
+    remaining = []
+    seen = set()
+    for f in files_list:
+        filename = f["name"].split("/")[-1]
+        md5 = f.get("md5")
+        if md5 in loaded:
+            duplicates[filename] = (md5, loaded[md5])
+        elif md5 and md5 in seen:
+            logger.info(f"Deferring '{filename}': same content as another file in this batch.")
+        else:
+            if md5:
+                seen.add(md5)
+            remaining.append(f)
+    if duplicates:
+        moved = utils.move_staged_files(session, list(duplicates), stages["raw"], stages["complete"])
+        for filename, (md5, original) in duplicates.items():
+            if moved[filename]:
+                logger.info(f"Skipped '{filename}': duplicate of '{original['filename']}' loaded at {original['loaded_at']} (md5 {md5}).")
+                index.record(md5, filename, duplicate_of=original["filename"])
+    return remaining
+
+
+def record_loaded_files(index, files_list: List[dict], summary: Dict[str, Any]) -> None:
+    """
+    Adds the files that run_batch loaded successfully to the processed files index.
+    """
+    md5s = {f["name"].split("/")[-1]: f.get("md5") for f in files_list}
+    for filename, result in summary["files"].items():
+        if result:
+            index.record(md5s.get(filename), filename, sum(result.values()))
+
+
+def process_raw_stage(session: Session, stages: Dict[str, str], config: Dict[str, Any],
+                      index=None, pool=None) -> Optional[Dict[str, Any]]:
+    """
+    Lists the raw stage (filtered, ordered and limited by the list_* settings), moves
+    files that were already ingested to the complete stage if an index is given, and
+    processes the rest with run_batch.  The phases of the run are published with
+    metrics.publish, as JSON log lines and to run_metrics_table.  The memory budget
+    (memory_budget_mb) is applied to all file workers of the run.
+
+    Args:
+        session: The Snowpark session to use.
+        stages: The stage names, keyed by "raw", "processing", "complete" and "error".
+        config: The [snowflake] section of the configuration file.
+        index: The processed_index.ProcessedFilesIndex for dedupe, or None.
+        pool: The session_pool.SessionPool for the file workers, or None.
+
+    Returns:
+        dict: The run_batch summary, or None if there was nothing to process.
+
+    Raises:
+        RuntimeError: If the raw stage could not be listed.
+    """
+    governor = memory_governor.configure(config)
+    run = metrics.RunMetrics()
+    with metrics.collect(run):
+        list_order = config.get("list_order", "-size")
+        with metrics.phase("list") as counts:
+            files_list = utils.list_files_in_stage(session, stages["raw"],
+                                                   pattern=config.get("list_pattern"),
+                                                   glob=config.get("list_glob"),
+                                                   order_by=list_order.lstrip("-") or None,
+                                                   descending=list_order.startswith("-"),
+                                                   limit=config.get("list_limit"))
+            counts["rows"] = len(files_list or [])
+        if files_list is None:
+            raise RuntimeError(f"Could not list stage {stages['raw']}")
+        if index is not None and files_list:
+            # Files already ingested under another name go straight to complete
+            files_list = skip_duplicates(session, files_list, stages, index)
+        if not files_list:
+            return None
+        filenames = [f["name"].split("/")[-1] for f in files_list]
+        sizes = {f["name"].split("/")[-1]: f["size"] for f in files_list}
+        uploaded = {f["name"].split("/")[-1]: utils.LISTING_ORDER_KEYS["last_modified"](f).timestamp()
+                    for f in files_list}
+        summary = run_batch(session, filenames, stages, config, sizes, pool, uploaded)
+        if index is not None:
+            record_loaded_files(index, files_list, summary)
+    summary["run_id"] = run.run_id
+    if governor is not None:
+        summary["memory_peak_mb"] = governor.peak / 2**20
+    metrics.publish(run, session, config)
+    return summary
@@ -0,0 +1,109 @@
+import logging
+import os
+import signal
+import threading
+from typing import Any, Callable, Dict, Optional
+from snowflake.snowpark import Session
+import scheduler
+from processed_index import create_index
+from session_pool import close_session, create_session_pool
+
+logger = logging.getLogger(__name__)
+
+# OAuth token that Snowpark Container Services rotates for the service
+TOKEN_PATH = "/snowflake/session/token"
+
+
+def token_version(token_path: str = TOKEN_PATH) -> Optional[float]:
+    """
+    Returns the modification time of the service token, which changes whenever
+    Snowflake refreshes it, or None outside Snowpark Container Services.
+    """
+    try:
+        return os.path.getmtime(token_path)
+    except OSError:
+        return None
+
+
+def install_signal_handlers(stop: threading.Event) -> None:
+    """
+    Sets stop on SIGTERM (sent when the service is suspended or dropped) and SIGINT, so
+    the service finishes the batch in progress and exits instead of being killed in
+    the middle of a load.  Only possible from the main thread.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    def request_stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping after the current batch.")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+
+def run_service(connect: Callable[[], Session], stages: Dict[str, str], config: Dict[str, Any],
+                session: Optional[Session] = None, stop: Optional[threading.Event] = None) -> None:
+    """
+    Runs the extraction as a long-running service: keeps one warm session, polls the
+    raw stage and processes files as they arrive, until stop is set or a SIGTERM or
+    SIGINT arrives.  A batch that was started is always finished.
+
+    The wait between polls starts at poll_min_seconds and doubles after every empty
+    poll or failure up to poll_max_seconds; it drops back as soon as files show up.
+    The session is replaced between batches when the service token has been
+    refreshed, and after a failed poll, so an expired login never stops the service;
+    the file workers use a session_pool.SessionPool if session_pool_size is set.
+
+    Args:
+        connect: Creates a new Snowpark session, reading the current token.
+        stages: The stage names, keyed by "raw", "processing", "complete" and "error".
+        config: The [snowflake] section of the configuration file.
+        session (Session, optional): An already connected session to start with.
+        stop (threading.Event, optional): Set to stop the service.  Defaults to a new
+            event set by the signal handlers.
+    """
+    if stop is None:
+        stop = threading.Event()
+        install_signal_handlers(stop)
+    min_wait = config.get("poll_min_seconds", 5)
+    max_wait = config.get("poll_max_seconds", 300)
+    wait = min_wait
+    token_seen = token_version()
+    session = session or connect()
+    index = create_index(session, config)
+    pool = create_session_pool(connect, config)
+    reconnect = False
+    logger.info(f"Service started, polling stage {stages['raw']} every {min_wait}s to {max_wait}s.")
+
+    while not stop.is_set():
+        if reconnect or token_version() != token_seen:
+            token_seen = token_version()
+            try:
+                old_session, session = session, connect()
+                index = create_index(session, config)
+                close_session(old_session)
+                reconnect = False
+                logger.info("Reconnected with a refreshed session.")
+            except Exception as e:
+                logger.error(f"Could not reconnect to Snowflake: {e}")
+                stop.wait(wait)
+                wait = min(wait * 2, max_wait)
+                continue
+        try:
+            summary = scheduler.process_raw_stage(session, stages, config, index, pool)
+        except Exception as e:
+            logger.error(f"Polling stage {stages['raw']} failed: {e}")
+            summary = None
+            reconnect = True
+        if summary:
+            wait = min_wait
+        stop.wait(wait)
+        if not summary:
+            wait = min(wait * 2, max_wait)
+
+    if pool is not None:
+        pool.close()
+    close_session(session)
+    logger.info("Service stopped.")
+
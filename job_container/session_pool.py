@@ -0,0 +1,129 @@
+import contextlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from snowflake.snowpark import Session
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPool:
+    """
+    A pool of Snowpark sessions handing out one session per worker, so parallel file
+    workers do not share a single connection.
+
+    At most max_sessions sessions are checked out at a time; further callers wait for
+    one to be returned, so scaling out workers never opens a storm of connections.
+    Sessions are created lazily by connect, which reads the current service token, and
+    are replaced on checkout once they are older than max_age_seconds, well before the
+    token they were created with expires.  A session that sat idle for more than
+    validate_after_seconds is checked with a trivial query and replaced if it fails.
+    """
+
+    def __init__(self, connect: Callable[[], Session], max_sessions: int = 4, max_age_seconds: float = 1800,
+                 validate_after_seconds: float = 60):
+        """
+        Args:
+            connect (Callable[[], Session]): Creates a new session.
+            max_sessions (int, optional): Maximum concurrent sessions. Defaults to 4.
+            max_age_seconds (float, optional): Sessions older than this are replaced on
+                checkout. Defaults to 1800.
+            validate_after_seconds (float, optional): Idle sessions older than this are
+                validated on checkout. Defaults to 60.
+        """
+        self.connect = connect
+        self.max_age_seconds = max_age_seconds
+        self.validate_after_seconds = validate_after_seconds
+        self.slots = threading.BoundedSemaphore(max(1, max_sessions))
+        self.lock = threading.Lock()
+        # (session, created, last returned) of the sessions not checked out
+        self.idle: List[Tuple[Session, float, float]] = []
+        self.closed = False
+
+    @contextlib.contextmanager
+    def session(self) -> Iterator[Session]:
+        """
+        Checks out a session for the duration of the with block.  A session whose block
+        raised is discarded rather than returned, in case the connection is broken.
+        """
+        self.slots.acquire()
+        try:
+            session, created = self._checkout()
+            try:
+                yield session
+            except BaseException:
+                close_session(session)
+                raise
+            with self.lock:
+                if self.closed:
+                    close_session(session)
+                else:
+                    self.idle.append((session, created, time.monotonic()))
+        finally:
+            self.slots.release()
+
+    def _checkout(self) -> Tuple[Session, float]:
+        while True:
+            with self.lock:
+                if self.closed:
+                    raise RuntimeError("The session pool is closed")
+                entry = self.idle.pop() if self.idle else None
+            if entry is None:
+                return self.connect(), time.monotonic()
+            session, created, returned = entry
+            now = time.monotonic()
+            if now - created > self.max_age_seconds:
+                logger.info("Replacing a pooled session that is close to token expiry.")
+                close_session(session)
+                continue
+            if now - returned > self.validate_after_seconds and not _is_alive(session):
+                logger.warning("Discarding a pooled session that failed validation.")
+                close_session(session)
+                continue
+            return session, created
+
+    def close(self) -> None:
+        """
+        Closes the idle sessions; sessions still checked out are closed when returned.
+        """
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for session, _, _ in idle:
+            close_session(session)
+
+
+def create_session_pool(connect: Callable[[], Session], config: Dict[str, Any]) -> Optional[SessionPool]:
+    """
+    Creates the session pool for the file workers if the configuration asks for one.
+
+    Args:
+        connect (Callable[[], Session]): Creates a new session.
+        config (dict): The [snowflake] section of the configuration file; reads
+            session_pool_size (0 shares one session), session_max_age_seconds and
+            session_validate_after_seconds.
+
+    Returns:
+        Optional[SessionPool]: The pool, or None if session_pool_size is 0.
+    """
+    max_sessions = config.get("session_pool_size", 0)
+    if max_sessions <= 0:
+        return None
+    return SessionPool(connect, max_sessions, config.get("session_max_age_seconds", 1800),
+                       config.get("session_validate_after_seconds", 60))
+
+
+def _is_alive(session: Session) -> bool:
+    try:
+        session.sql("SELECT 1").collect()
+        return True
+    except Exception:
+        return False
+
+
+def close_session(session: Session) -> None:
+    try:
+        session.close()
+    except Exception as e:
+        logger.warning(f"Could not close the session: {e}")
@@ -1,50 +1,116 @@
 
-from typing import List, Optional
+from typing import List, Optional, Iterator, Tuple, Dict, Any
 from snowflake.snowpark import Session
-from access_util import MSAccessUtils
-from pathlib import Path
-import tempfile, os, json
+from access_util import MSAccessUtils, ExportProcesses
+from loaders import create_loader, get_target_table_name, batch_nbytes, build_load_frame, sql_string
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+import tempfile, os, json, shutil, threading, weakref, re, time, fnmatch, email.utils
 from snowflake.snowpark.types import StructType, StructField, VariantType
-import pandas as pd
 import datetime
+import metrics
+import profiling
+
+
+# Sort keys accepted by list_files_in_stage; "last_modified" orders oldest first.
+LISTING_ORDER_KEYS = {
+    "name": lambda file: file["name"],
+    "size": lambda file: file["size"],
+    "last_modified": lambda file: email.utils.parsedate_to_datetime(file["last_modified"]),
+}
 
 
 def list_files_in_stage(
     session,
     stage_name: str,
-    path: str = ''
-) -> Optional[List[str]]:
+    path: str = '',
+    pattern: Optional[str] = None,
+    glob: Optional[str] = None,
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    limit: Optional[int] = None
+) -> Optional[List[Dict[str, Any]]]:
     """
-    Lists files in a Snowflake stage, with optional filtering by path and pattern.
+    Lists files in a Snowflake stage with a single LIST query, with optional filtering,
+    ordering and a limit for processing a large stage in pages.
 
     Args:
-        connection_params (dict): A dictionary containing Snowflake connection parameters.
-            See https://docs.snowflake.com/en/developer-guide/python-connector-api.html#connect
-            for available parameters (e.g., 'user', 'password', 'account', 'warehouse', 'database', 'schema').
+        session (Session): The Snowpark session to use.
         stage_name (str): The name of the Snowflake stage.
         path (str, optional): The path within the stage to list files from. Defaults to ''.
-        pattern (str, optional):  A pattern to filter files by (e.g., 'data*.csv'). Defaults to '%'.
+        pattern (str, optional): A regular expression on the full stage path, applied by
+            LIST itself (e.g. '.*[.]accdb'). Defaults to None (all files).
+        glob (str, optional): A shell-style pattern on the file name (e.g. 'sales_*.mdb').
+            Defaults to None (all files).
+        order_by (str, optional): "name", "size" or "last_modified". Defaults to None,
+            which keeps the listing order.
+        descending (bool, optional): Reverse the order, e.g. largest or newest first.
+            Defaults to False.
+        limit (int, optional): Return at most this many files. Defaults to None.
 
     Returns:
-        Optional[List[str]]: A list of file names in the stage that match the pattern, or None on error.
+        Optional[List[dict]]: The name, size, md5 and last_modified of each file, or
+            None on error.
     """
     try:
-        # List files in the stage
-        
-        sql=f"LIST '@{stage_name}/{path}';"
-        files_df = session.sql(sql)
-        if files_df.count() == 0:
-            return []  # Return an empty list if no files found
-        files = files_df.collect() # Collect only if there are results
-        # Extract file names and last modified times.  Convert the last_modified time.
-        file_list = [{"name": file.name, "last_modified": file.last_modified} for file in files]
+        sql = f"LIST '@{stage_name}/{path}'"
+        if pattern:
+            sql += f" PATTERN = {sql_string(pattern)}"
+        files = session.sql(sql).collect()
+        file_list = [{"name": file.name, "size": file.size, "md5": file.md5, "last_modified": file.last_modified} for file in files]
+        if glob:
+            file_list = [file for file in file_list if fnmatch.fnmatch(file["name"].split("/")[-1], glob)]
+        if order_by:
+            file_list.sort(key=LISTING_ORDER_KEYS[order_by], reverse=descending)
+        if limit is not None:
+            file_list = file_list[:limit]
         return file_list
     except Exception as e:
         print(f"Error: {e}")
         return None
 
-    finally:
-        pass
+
+# Stages known to exist, per session.  Only positive results are cached, so a stage
+# created elsewhere is still picked up; invalidate_stage_cache forgets stages again.
+_stage_cache = weakref.WeakKeyDictionary()
+_stage_cache_lock = threading.Lock()
+
+
+def stage_exists(session: Session, stage_name: str) -> bool:
+    """
+    Checks whether a stage exists with SHOW STAGES, remembering stages that do for the
+    lifetime of the session so repeated checks cost no query.
+
+    Args:
+        session: The Snowpark Session object.
+        stage_name: The stage name, optionally followed by a path ("my_stage/data").
+
+    Returns:
+        True if the stage exists, False otherwise.
+    """
+    stage_name = stage_name.split('/')[0].upper()
+    with _stage_cache_lock:
+        if stage_name in _stage_cache.get(session, ()):
+            return True
+    if not session.sql(f"SHOW STAGES LIKE '{stage_name}'").collect():
+        return False
+    with _stage_cache_lock:
+        _stage_cache.setdefault(session, set()).add(stage_name)
+    return True
+
+
+def invalidate_stage_cache(session: Session, stage_name: Optional[str] = None) -> None:
+    """
+    Forgets cached stage existence for a session: one stage, or all of them if
+    stage_name is None.  Call it after creating or dropping a stage.
+    """
+    with _stage_cache_lock:
+        if stage_name is None:
+            _stage_cache.pop(session, None)
+        else:
+            _stage_cache.get(session, set()).discard(stage_name.split('/')[0].upper())
+
 
 def move_staged_file(
     session: Session,
@@ -70,121 +136,523 @@ def move_staged_file(
     Returns:
         True if the file was moved successfully, False otherwise.
     """
-    try:
-        # Extract stage names
-        source_stage_name = source_stage.split('/')[0].upper()
-        target_stage_name = target_stage.split('/')[0].upper()
+    with metrics.phase("move", rows=1):
+        try:
+            # Extract stage names
+            source_stage_name = source_stage.split('/')[0].upper()
+            target_stage_name = target_stage.split('/')[0].upper()
 
 
-        # Check if the source stage exists
-        if not session.sql(f"SHOW STAGES LIKE '{source_stage_name}'").collect():
-            print(f"Error: Source stage '{source_stage_name}' does not exist.")
-            return False
+            # Check if the source stage exists
+            if not stage_exists(session, source_stage_name):
+                print(f"Error: Source stage '{source_stage_name}' does not exist.")
+                return False
 
-        # Check if the target stage exists, and create it if requested
-        if not session.sql(f"SHOW STAGES LIKE '{target_stage_name}'").collect():
-            if create_target_stage:
-                try:
-                    session.sql(f"CREATE STAGE {target_stage_name}").collect()
-                    print(f"Target stage '{target_stage_name}' created.")
-                except Exception as e:
-                    print(f"Error creating target stage '{target_stage_name}': {e}")
+            # Check if the target stage exists, and create it if requested
+            if not stage_exists(session, target_stage_name):
+                if create_target_stage:
+                    try:
+                        session.sql(f"CREATE STAGE {target_stage_name}").collect()
+                        invalidate_stage_cache(session, target_stage_name)
+                        print(f"Target stage '{target_stage_name}' created.")
+                    except Exception as e:
+                        print(f"Error creating target stage '{target_stage_name}': {e}")
+                        return False
+                else:
+                    print(f"Error: Target stage '{target_stage_name}' does not exist.")
                     return False
-            else:
-                print(f"Error: Target stage '{target_stage_name}' does not exist.")
-                return False
 
-        # Use the COPY INTO location command to move the file
-        copy_statement = f"""
-            COPY FILES INTO @{target_stage}
-            FROM @{source_stage}
-            FILES = ('{file_name}')
-        """
-        session.sql(copy_statement).collect()
-
-        # Check the copy result
-        copy_result = session.sql(f"SELECT * FROM TABLE(RESULT_SCAN(LAST_QUERY_ID()))").collect()
-        if not copy_result:
-            print("Error: Copy operation failed. No result returned from COPY INTO.")
-            return False
-        # Remove the file from the source stage
-        remove_statement = f"REMOVE @{source_stage}/{file_name}"
-        remove_result = session.sql(remove_statement).collect()
-        remove_result_string = str(remove_result[0]["result"])
+            # Use the COPY INTO location command to move the file
+            copy_statement = f"""
+                COPY FILES INTO @{target_stage}
+                FROM @{source_stage}
+                FILES = ('{file_name}')
+            """
+            session.sql(copy_statement).collect()
 
-        if remove_result_string.startswith("removed"):
-            print(f"File '{file_name}' successfully moved to '{target_stage}'.")
-            return True
-        else:
-            print(f"Warning: File '{file_name}' was copied, but failed to remove.  You may need to remove it manually. Remove result: {remove_result_string}")
-            return True
+            # Check the copy result
+            copy_result = session.sql(f"SELECT * FROM TABLE(RESULT_SCAN(LAST_QUERY_ID()))").collect()
+            if not copy_result:
+                print("Error: Copy operation failed. No result returned from COPY INTO.")
+                return False
+            # Remove the file from the source stage
+            remove_statement = f"REMOVE @{source_stage}/{file_name}"
+            remove_result = session.sql(remove_statement).collect()
+            remove_result_string = str(remove_result[0]["result"])
 
-    except Exception as e:
-        print(f"Error moving file: {e}")
-        return False
+            if remove_result_string.startswith("removed"):
+                print(f"File '{file_name}' successfully moved to '{target_stage}'.")
+                return True
+            else:
+                print(f"Warning: File '{file_name}' was copied, but failed to remove.  You may need to remove it manually. Remove result: {remove_result_string}")
+                return True
+
+        except Exception as e:
+            print(f"Error moving file: {e}")
+            # The failure may be a stage that was dropped since it was cached
+            invalidate_stage_cache(session, source_stage)
+            invalidate_stage_cache(session, target_stage)
+            return False
     
     
-def write_json_string_to_table(session: Session, json_string: str, filename: str) -> None:
+def _stage_path_pattern(stage: str) -> str:
+    """
+    Returns a regular expression matching the listed path prefix ("<stage>/<path>/")
+    of the files directly under a stage location such as "my_stage" or "my_stage/data".
+    """
+    path = stage.split('/', 1)[1].strip('/') if '/' in stage else ''
+    return "[^/]+/" + (re.escape(path) + "/" if path else "")
+
+
+def move_staged_files(
+    session: Session,
+    file_names: List[str],
+    source_stage: str,
+    target_stage: str,
+    create_target_stage: bool = False,
+    batch_size: int = 500
+) -> Dict[str, bool]:
     """
-    Writes a JSON string to a Snowflake table.  The JSON string is treated as a single row
-    with a single VARIANT column.
+    Moves many files from one stage to another with one COPY FILES and one REMOVE per
+    batch_size files, instead of the three queries per file of move_staged_file.
+
+    Args:
+        session: The Snowpark Session object.
+        file_names: The names of the files to move.
+        source_stage: The source stage, optionally with a path (e.g., "my_stage/data").
+        target_stage: The target stage, optionally with a path.
+        create_target_stage: Boolean indicating whether to create the target stage if it doesn't exist.
+            Defaults to False.
+        batch_size: Maximum number of files per COPY FILES / REMOVE statement. Defaults to 500.
+
+    Returns:
+        Dict[str, bool]: For each file name, True if the file was copied to the target
+            stage, False otherwise.  As with move_staged_file, a file that was copied
+            but could not be removed from the source still counts as moved.
+    """
+    results = {name: False for name in file_names}
+    if not file_names:
+        return results
+    with metrics.phase("move") as counts:
+        try:
+            if not stage_exists(session, source_stage):
+                print(f"Error: Source stage '{source_stage.split('/')[0].upper()}' does not exist.")
+                return results
+            if not stage_exists(session, target_stage):
+                target_stage_name = target_stage.split('/')[0].upper()
+                if not create_target_stage:
+                    print(f"Error: Target stage '{target_stage_name}' does not exist.")
+                    return results
+                session.sql(f"CREATE STAGE {target_stage_name}").collect()
+                invalidate_stage_cache(session, target_stage_name)
+                print(f"Target stage '{target_stage_name}' created.")
+
+            for start in range(0, len(file_names), batch_size):
+                batch = file_names[start:start + batch_size]
+                copy_statement = f"""
+                    COPY FILES INTO @{target_stage}
+                    FROM @{source_stage}
+                    FILES = ({", ".join(sql_string(name) for name in batch)})
+                """
+                # COPY FILES returns one row per copied file
+                copied = {str(row[0]).split('/')[-1] for row in session.sql(copy_statement).collect()}
+                copied = [name for name in batch if name in copied]
+                for name in copied:
+                    results[name] = True
+                if not copied:
+                    continue
+
+                # Anchored to the source path: COPY FILES only copied the files directly
+                # under it, not files of the same name in its subfolders
+                pattern = _stage_path_pattern(source_stage) + "(" + "|".join(re.escape(name) for name in copied) + ")"
+                remove_result = session.sql(f"REMOVE @{source_stage} PATTERN = {sql_string(pattern)}").collect()
+                removed = {str(row["name"]).split('/')[-1] for row in remove_result
+                           if str(row["result"]).startswith("removed")}
+                not_removed = [name for name in copied if name not in removed]
+                if not_removed:
+                    print(f"Warning: {len(not_removed)} files were copied to '{target_stage}' but not removed from '{source_stage}'.  You may need to remove them manually: {not_removed}")
+            counts["rows"] = sum(results.values())
+            print(f"{sum(results.values())} of {len(file_names)} files moved to '{target_stage}'.")
+        except Exception as e:
+            print(f"Error moving files: {e}")
+            invalidate_stage_cache(session, source_stage)
+            invalidate_stage_cache(session, target_stage)
+    return results
+
+
+def write_table_data(session: Session, table_data: Dict[str, List[dict]], filename: str) -> Optional[str]:
+    """
+    Writes extracted Access tables, held in memory, to a new <filename>_<timestamp>
+    table without serializing them first.  Each row becomes one VARIANT 'row' value
+    next to its Access table name, the filename and the load timestamp.
 
     Args:
         session: The Snowpark session to use.
-        json_string: The JSON string to write.
-        table_name: The name of the table to write to.
-        create_table:  Boolean indicating whether to create the table if it doesn't exist.
-                       If True, the table is created with a single VARIANT column.
-                       If False, the table must already exist with a compatible schema.
+        table_data: The rows of each Access table, keyed by table name.
+        filename: The name of the Access file the tables come from.
+
+    Returns:
+        str: The name of the table written, or None on error.
     """
-    
     now = datetime.datetime.now()
-    timestamp_string=""
-    timestamp_string = now.strftime("%Y%m%d_%H%M%S")
-    target_table_name=f"{filename.replace('.','_')}_{timestamp_string}"
-    accessdb_tablename='table_name'
-    rowname='row'
-    df=pd.DataFrame(columns=[accessdb_tablename, rowname, "filename", "timestamp"])
-    
+    target_table_name=get_target_table_name(filename, now)
     try:
-        # 1. Parse the JSON string
-        try:
-            jsonObj=json.loads(json_string)
-            for tablename in jsonObj.keys():
-                tmpdf=pd.DataFrame({accessdb_tablename: tablename, rowname:jsonObj[tablename], "filename":filename, "timestamp":now})
-                df=pd.concat([df, tmpdf], ignore_index=True)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON string: {e}")    
+        df=build_load_frame(table_data.items(), filename, now)
         session.write_pandas(df, target_table_name, auto_create_table=True, overwrite=True)
+        print(f"Wrote {summarize_tables(table_data)} to {target_table_name}")
+        return target_table_name
     except Exception as e:
-        print(f"Error writing JSON to table: {e}") 
-    
-    
-def process_file(session,filename, stage_name):
-    # Save file to a temporary location
-    stage_file_url = f"{stage_name}/{filename}"
-    temp_file_path = str(Path(tempfile.gettempdir()))
-    #file_stream = session.file.get_stream(stage_file_url,)
-    #file_bytes = file_stream.readall()  # Read all bytesbytes
+        print(f"Error writing table data: {e}")
+        return None
+
+
+def write_json_string_to_table(session: Session, json_string: str, filename: str) -> None:
+    """
+    Writes a JSON string to a Snowflake table.  The JSON string is an object with the
+    rows of each Access table keyed by table name.  Kept for callers that already hold
+    JSON; in-process callers should pass the tables to write_table_data directly.
+
+    Args:
+        session: The Snowpark session to use.
+        json_string: The JSON string to write.
+        filename: The name of the Access file the tables come from.
+    """
     try:
-        tmpf=session.file.get(stage_file_url, temp_file_path)
-    except Exception as e:
-        return f"Error saving uploaded file: {e}"
-    fullpath=f"{temp_file_path}/{filename}"
+        jsonObj=json.loads(json_string)
+    except json.JSONDecodeError as e:
+        print(f"Error writing JSON to table: Invalid JSON string: {e}")
+        return
+    write_table_data(session, jsonObj, filename)
+
+
+def summarize_tables(table_data: Dict[str, Any]) -> str:
+    """
+    Describes tables by name, row count and approximate size for logging, instead of
+    logging their contents.
+
+    Args:
+        table_data: Rows or typed batches of each Access table, keyed by table name.
+
+    Returns:
+        str: e.g. "2 tables, 10 rows, 0.0 MB (customers: 6 rows, orders: 4 rows)".
+    """
+    rows = {name: len(data) for name, data in table_data.items()}
+    nbytes = sum(batch_nbytes(data) for data in table_data.values())
+    details = ", ".join(f"{name}: {count} rows" for name, count in rows.items())
+    return f"{len(rows)} tables, {sum(rows.values())} rows, {nbytes / 1e6:.1f} MB ({details})"
+
+
+# RAM-backed filesystem used for downloads that fit under the memory limit
+RAM_SCRATCH_DIR = "/dev/shm"
+
+# Bytes of the files currently downloaded to RAM_SCRATCH_DIR, by directory.  /dev/shm is
+# charged to the container's memory, so the total is capped (memory_total_bytes).
+_ram_downloads: Dict[str, int] = {}
+_ram_downloads_lock = threading.Lock()
+
+
+def download_staged_file(
+    session: Session,
+    stage_name: str,
+    filename: str,
+    scratch_dir: str,
+    file_size: Optional[int] = None,
+    memory_limit_bytes: int = 0,
+    parallel: int = 4,
+    memory_total_bytes: Optional[int] = None
+) -> str:
+    """
+    Downloads a staged file for extraction.  When its size is known, is at most
+    memory_limit_bytes, fits in the free space of the RAM-backed /dev/shm and keeps the
+    files downloaded there within memory_total_bytes, the file lands there so mdb-tools
+    read it from memory; otherwise it goes to scratch_dir on disk.  The download
+    throughput is printed so slow runs can be attributed to the network or to
+    extraction.
+
+    Args:
+        session: The Snowpark session to use.
+        stage_name: The stage holding the file.
+        filename: The name of the staged file.
+        scratch_dir: The on-disk directory to spill to.
+        file_size: The size of the staged file in bytes (from LIST), if known.
+        memory_limit_bytes: The largest file kept in memory. 0 (the default) disables
+            RAM downloads.
+        parallel: Number of threads used by GET for large files.
+        memory_total_bytes: The most bytes of all files in memory at once.  Defaults
+            to memory_limit_bytes.
+
+    Returns:
+        str: The local path of the downloaded file.  If it is not inside scratch_dir, it
+            is in a directory of its own that the caller must remove with
+            remove_fetched_file.
+    """
+    if memory_total_bytes is None:
+        memory_total_bytes = memory_limit_bytes
+    target_dir = scratch_dir
+    in_memory = (
+        file_size is not None
+        and file_size <= memory_limit_bytes
+        and os.path.isdir(RAM_SCRATCH_DIR)
+        and shutil.disk_usage(RAM_SCRATCH_DIR).free > file_size * 1.1
+    )
+    if in_memory:
+        with _ram_downloads_lock:
+            in_memory = sum(_ram_downloads.values()) + file_size <= memory_total_bytes
+            if in_memory:
+                # Released by remove_fetched_file
+                target_dir = tempfile.mkdtemp(prefix="msaccess_", dir=RAM_SCRATCH_DIR)
+                _ram_downloads[target_dir] = file_size
+    start = time.monotonic()
     try:
-        # Read the table data
-        tablelist=MSAccessUtils.read_access_file(fullpath)
-        print(f"Tables: {tablelist}\n")
-        
-        table_data={}
-        for table in tablelist["tables"]:
-            table_data[table]=MSAccessUtils.read_table_data(fullpath, table)
-        print(f"{json.dumps(table_data)}\n")
-        write_json_string_to_table(session, json.dumps(table_data), filename)
-        
-    except Exception as e:
-        return f"Error extracting files: {e}"
-    finally:
-        # Delete the temporary file
+        session.file.get(f"{stage_name}/{filename}", target_dir, parallel=parallel)
+    except Exception:
+        if in_memory:
+            _release_ram_download(target_dir)
+        raise
+    elapsed = max(time.monotonic() - start, 1e-9)
+    fullpath = os.path.join(target_dir, filename)
+    size = os.path.getsize(fullpath)
+    print(f"Downloaded '{filename}' ({size / 1e6:.1f} MB) to {'memory' if in_memory else 'disk'} "
+          f"in {elapsed:.2f}s: {size / 1e6 / elapsed:.1f} MB/s")
+    return fullpath
+
+
+def _release_ram_download(target_dir: str) -> None:
+    shutil.rmtree(target_dir, ignore_errors=True)
+    with _ram_downloads_lock:
+        _ram_downloads.pop(target_dir, None)
+
+
+def iter_table_batches(
+    fullpath: str,
+    tables: List[str],
+    batch_size: int,
+    scratch_dir: str,
+    max_workers: int = 1,
+    typed: bool = False
+) -> Iterator[Tuple[str, Iterator]]:
+    """
+    Yields (table_name, batches) for every table of an Access file, in the order of
+    tables.  With max_workers > 1 up to max_workers mdb-export subprocesses run at once,
+    each spooling its table to a CSV file in scratch_dir, while the caller consumes
+    the tables that are already exported.  Each table's batches must be consumed
+    before asking for the next table.
+
+    At most 2 * max_workers tables are exported ahead of the consumer, which bounds both
+    the number of subprocesses and the scratch disk used; Python memory stays bounded by
+    batch_size because the spooled files are read back in batches.
+
+    Args:
+        fullpath: Path to the MS Access file.
+        tables: The table names, in the order the results should be returned.
+        batch_size: Maximum number of rows per batch.
+        scratch_dir: Directory for the spooled CSV files.
+        max_workers: Maximum number of concurrent mdb-export subprocesses.
+        typed: Yield typed pandas DataFrames built from the mdb-schema column types
+               instead of lists of string dictionaries.
+    """
+    if max_workers <= 1:
+        for table in tables:
+            if typed:
+                yield table, MSAccessUtils.read_table_frames(fullpath, table, batch_size)
+            else:
+                yield table, MSAccessUtils.read_table_batches(fullpath, table, batch_size)
+        return
+
+    queued = iter(enumerate(tables))
+    pending = deque()
+    processes = ExportProcesses()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mdb-export") as pool:
+        def submit_next():
+            for index, table in queued:
+                csv_path = os.path.join(scratch_dir, f"table_{index}.csv")
+                pending.append((table, csv_path, pool.submit(metrics.bind(MSAccessUtils.export_table_to_csv),
+                                                             fullpath, table, csv_path, typed, processes)))
+                return
+
+        for _ in range(2 * max_workers):
+            submit_next()
+        try:
+            while pending:
+                table, csv_path, future = pending.popleft()
+                future.result()
+                if typed:
+                    schema = MSAccessUtils.read_table_schema(fullpath, table)
+                    yield table, MSAccessUtils.read_csv_frames(csv_path, schema, batch_size)
+                else:
+                    yield table, MSAccessUtils.read_csv_batches(csv_path, batch_size)
+                os.remove(csv_path)
+                submit_next()
+        finally:
+            # Closing the generator early (a failed load) must not wait for the
+            # remaining exports: cancel the queued ones and kill the running ones
+            for _, _, future in pending:
+                future.cancel()
+            if pending:
+                processes.kill_all()
+
+
+def fetch_staged_file(session: Session, stage_name: str, filename: str, scratch_dir: str,
+                      config: Optional[Dict[str, Any]] = None, file_size: Optional[int] = None) -> str:
+    """
+    Downloads a staged Access file with the download settings of the configuration
+    (memory_download_mb, memory_download_total_mb, download_parallel), see
+    download_staged_file.
+
+    Returns:
+        str: The local path of the file.  Remove it with remove_fetched_file.
+    """
+    config = config or {}
+    with metrics.phase("download") as counts:
+        memory_limit_mb = config.get("memory_download_mb", 0)
+        fullpath = download_staged_file(session, stage_name, filename, scratch_dir, file_size,
+                                        int(memory_limit_mb * 1024 * 1024),
+                                        config.get("download_parallel", 4),
+                                        int(config.get("memory_download_total_mb", memory_limit_mb) * 1024 * 1024))
+        counts["bytes"] = os.path.getsize(fullpath)
+    return fullpath
+
+
+def remove_fetched_file(fullpath: str, scratch_dir: str) -> None:
+    """
+    Deletes a file returned by fetch_staged_file, and its RAM directory if it has one.
+    """
+    directory = os.path.dirname(fullpath)
+    with _ram_downloads_lock:
+        in_memory = directory in _ram_downloads
+    if in_memory:
+        _release_ram_download(directory)
+    elif os.path.exists(fullpath):
         os.remove(fullpath)
-        return table_data
+
+
+def process_local_file(session, filename: str, fullpath: str, scratch_dir: str,
+                       config: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, int]]:
+    """
+    Streams every table out of a downloaded Access file in batches and hands each batch
+    to the configured loader as soon as it is extracted, so memory use depends on the
+    batch size rather than on the table size.  Several tables can be exported
+    concurrently; batches still reach the loader in table order.  With profiling on
+    (see profiling.profiling_enabled) the file and each table are profiled.
+
+    Args:
+        session: The Snowpark session to use.
+        filename: The name of the staged Access file.
+        fullpath: The local path of the downloaded file.
+        scratch_dir: Directory for spooled exports and load files.  Files that are
+                     processed concurrently must use different directories.
+        config: The [snowflake] section of the configuration file, see process_file.
+
+    Returns:
+        dict: The number of rows loaded per Access table, or None on error.
+    """
+    config = config or {}
+    batch_size = config.get("batch_size", 10000)
+    table_workers = config.get("table_workers", 1)
+    # Native tables need the column types, so they always use typed extraction.
+    typed = config.get("extract_mode", "rows") == "typed" or config.get("load_mode") == "native"
+    table_counts={}
+    with profiling.profile_file(session, filename, config) as profiler:
+        try:
+            # Read the table data
+            tablelist=MSAccessUtils.read_access_file(fullpath)
+            if "error" in tablelist:
+                raise RuntimeError(tablelist["error"])
+            print(f"Tables: {tablelist['tables']}\n")
+
+            loader=create_loader(session, filename, scratch_dir, config)
+            tables=[t for t in tablelist["tables"] if t]
+            try:
+                # closing() cancels the queued exports and kills the running mdb-export
+                # processes straight away if loading fails part way
+                with closing(iter_table_batches(fullpath, tables, batch_size, scratch_dir, table_workers, typed)) as exported:
+                    for table, batches in exported:
+                        table_counts[table]=0
+                        table_bytes=0
+                        with profiling.profile_table(profiler, table):
+                            # Time spent waiting for batches (export and parsing) vs handing them to the loader
+                            extract_seconds=load_seconds=0.0
+                            clock=time.monotonic()
+                            for batch in batches:
+                                loaded=time.monotonic()
+                                extract_seconds+=loaded-clock
+                                # Batches go straight to the loader: no copies, no serialization.
+                                loader.write_batch(table, batch)
+                                clock=time.monotonic()
+                                load_seconds+=clock-loaded
+                                table_counts[table]+=len(batch)
+                                table_bytes+=batch_nbytes(batch)
+                            extract_seconds+=time.monotonic()-clock
+                            metrics.record("extract", extract_seconds, table, table_counts[table], table_bytes)
+                            metrics.record("load", load_seconds, table, table_counts[table], table_bytes)
+                        print(f"Table '{table}': {table_counts[table]} rows, {table_bytes / 1e6:.1f} MB")
+                # Rows actually loaded per table: only the changes in load_mode "incremental"
+                loaded_counts={table: loader.loaded_rows.get(table, 0) for table in table_counts}
+                with metrics.phase("commit", rows=sum(loaded_counts.values())):
+                    loader.finish()
+                # Including delete markers for tables gone since the previous upload
+                loaded_counts.update(loader.loaded_rows)
+            except Exception:
+                # Leave no partially loaded target table behind
+                loader.abort()
+                raise
+            print(f"Loaded {sum(loaded_counts.values())} rows from {len(table_counts)} tables "
+                  f"({sum(table_counts.values())} extracted) into {loader.target_table_name}\n")
+
+        except Exception as e:
+            print(f"Error extracting files: {e}")
+            return None
+    return loaded_counts
+
+
+def process_file(session,filename, stage_name, config: Optional[Dict[str, Any]] = None, scratch_dir: Optional[str] = None,
+                 file_size: Optional[int] = None):
+    """
+    Downloads an Access file from a stage and extracts and loads it with
+    process_local_file.
+
+    Args:
+        session: The Snowpark session to use.
+        filename: The name of the staged Access file.
+        stage_name: The stage holding the file.
+        config: The [snowflake] section of the configuration file.  The keys used are:
+                batch_size: Maximum number of rows per batch (default 10000).
+                table_workers: Maximum number of tables exported concurrently (default 1).
+                extract_mode: "rows" for string values, or "typed" for typed columnar
+                              batches built from the mdb-schema column types.
+                load_mode: "variant" (write_pandas), "parquet" (PUT + COPY INTO) or
+                           "native" (one typed table per Access table), see
+                           loaders.create_loader.
+                memory_download_mb: Largest file downloaded to memory (default 0, off),
+                                    see download_staged_file.
+                memory_download_total_mb: Most MB of files in memory at once
+                                          (default memory_download_mb).
+                download_parallel: Threads used to download a file (default 4).
+        scratch_dir: Directory for the downloaded file, spooled exports and load files.
+                     Files that are processed concurrently must use different
+                     directories.  If None, a temporary directory is created and
+                     removed afterwards.
+        file_size: The size of the staged file in bytes, if known.  Needed for the
+                   file to be downloaded to memory.
+
+    Returns:
+        dict: The number of rows loaded per Access table, or None on error.
+    """
+    owns_scratch_dir = scratch_dir is None
+    if owns_scratch_dir:
+        scratch_dir=tempfile.mkdtemp(prefix="msaccess_")
+    fullpath=None
+    try:
+        # Save file to memory or the scratch location
+        try:
+            fullpath=fetch_staged_file(session, stage_name, filename, scratch_dir, config, file_size)
+        except Exception as e:
+            print(f"Error saving uploaded file: {e}")
+            return None
+        return process_local_file(session, filename, fullpath, scratch_dir, config)
+    finally:
+        # Delete the temporary file and any spooled table exports
+        if fullpath is not None:
+            remove_fetched_file(fullpath, scratch_dir)
+        if owns_scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
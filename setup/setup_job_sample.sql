@@ -50,3 +50,19 @@ SHOW TASKS;
 
 SHOW TASKS;
 --DROP TASK MSDB_EXTRACT_TASK;
+
+/* Option to run it as a long-running service instead (set run_mode = "service" in
+   configuration.toml); it polls the raw stage and stops gracefully on SUSPEND/DROP
+CREATE SERVICE IDENTIFIER($job_service_name)
+  IN COMPUTE POOL IDENTIFIER($compute_pool_name)
+  FROM SPECIFICATION $$
+    spec:
+      containers:
+      - name: msaccessextract
+        image: /msaccess/data/container_repository/msaccess_job_runner:latest
+    $$
+  MIN_INSTANCES=1
+  MAX_INSTANCES=1;
+SHOW SERVICES;
+--ALTER SERVICE IDENTIFIER($job_service_name) SUSPEND;
+*/
@@ -1,11 +1,214 @@
+import pandas as pd
 import streamlit as st
+import lib.utils.session  # Helper for session state
+
+lib.utils.session.initSnowflake()
+
+SESSION=st.session_state.snowflakesession.session
+CONFIG=st.session_state.snowflakesession.config or {}
+# Run metrics written by the ingestion job (see job_container/metrics.py)
+METRICS_TABLE=CONFIG.get("run_metrics_table") or "MSACCESS_RUN_METRICS"
+RAW_STAGE=CONFIG.get("raw_stage", "RAW")
+# Aggregates are computed in Snowflake and cached for this many seconds
+CACHE_TTL=CONFIG.get("dashboard_cache_seconds", 300)
+LOOKBACK_DAYS=[1, 7, 30, 90, 365]
+
+
+def run_query(query: str) -> pd.DataFrame:
+    """
+    Runs a query and returns the result as a DataFrame, or an empty one on error.
+    """
+    try:
+        return SESSION.sql(query).to_pandas()
+    except Exception as e:
+        st.error(f"Error running query: {e}")
+        return pd.DataFrame()
+
+
+def _window(days: int) -> str:
+    return f"STARTED_AT >= DATEADD(day, -{int(days)}, CURRENT_TIMESTAMP())"
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def files_per_hour(days: int) -> pd.DataFrame:
+    """
+    Files processed, failed and rows loaded per hour.
+    """
+    return run_query(f"""
+        SELECT DATE_TRUNC('hour', STARTED_AT) AS HOUR,
+               COUNT_IF(PHASE = 'file') AS FILES,
+               COUNT_IF(PHASE = 'error') AS ERRORS,
+               SUM(IFF(PHASE = 'file', "ROWS", 0)) AS LOADED_ROWS
+        FROM {METRICS_TABLE}
+        WHERE {_window(days)} AND PHASE IN ('file', 'error')
+        GROUP BY 1
+        ORDER BY 1
+    """)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def run_throughput(days: int) -> pd.DataFrame:
+    """
+    Files, failed files, rows and rows per second of wall time for every run.  A file
+    whose download failed has an 'error' record but no 'file' record, so files and
+    errors are counted by distinct file name.
+    """
+    return run_query(f"""
+        SELECT RUN_ID, RUN_STARTED_AT, FILES, ERRORS, LOADED_ROWS, WALL_SECONDS,
+               LOADED_ROWS / NULLIF(WALL_SECONDS, 0) AS ROWS_PER_SECOND, PEAK_RSS_MB
+        FROM (
+            SELECT RUN_ID,
+                   MIN(STARTED_AT) AS RUN_STARTED_AT,
+                   COUNT(DISTINCT IFF(PHASE IN ('file', 'error'), FILENAME, NULL)) AS FILES,
+                   COUNT(DISTINCT IFF(PHASE = 'error', FILENAME, NULL)) AS ERRORS,
+                   SUM(IFF(PHASE = 'file', "ROWS", 0)) AS LOADED_ROWS,
+                   DATEDIFF(millisecond, MIN(STARTED_AT),
+                            MAX(DATEADD(millisecond, SECONDS * 1000, STARTED_AT))) / 1000 AS WALL_SECONDS,
+                   MAX(PEAK_RSS_MB) AS PEAK_RSS_MB
+            FROM {METRICS_TABLE}
+            WHERE {_window(days)}
+            GROUP BY RUN_ID
+        )
+        ORDER BY RUN_STARTED_AT
+    """)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def phase_times(days: int) -> pd.DataFrame:
+    """
+    Total, mean and 95th percentile seconds of every pipeline phase.
+    """
+    return run_query(f"""
+        SELECT PHASE,
+               COUNT(*) AS CALLS,
+               SUM(SECONDS) AS TOTAL_SECONDS,
+               AVG(SECONDS) AS MEAN_SECONDS,
+               APPROX_PERCENTILE(SECONDS, 0.95) AS P95_SECONDS,
+               SUM(BYTES) / 1e6 AS MB
+        FROM {METRICS_TABLE}
+        WHERE {_window(days)} AND PHASE <> 'error'
+        GROUP BY PHASE
+        ORDER BY TOTAL_SECONDS DESC
+    """)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def error_rate(days: int) -> pd.DataFrame:
+    """
+    Share of processed files that went to the error stage, per day, by distinct file
+    name: a failed download records 'error' without a 'file' record.
+    """
+    return run_query(f"""
+        SELECT DATE_TRUNC('day', STARTED_AT) AS DAY,
+               COUNT(DISTINCT FILENAME) AS FILES,
+               COUNT(DISTINCT IFF(PHASE = 'error', FILENAME, NULL)) AS ERRORS,
+               ERRORS / NULLIF(FILES, 0) AS ERROR_RATE
+        FROM {METRICS_TABLE}
+        WHERE {_window(days)} AND PHASE IN ('file', 'error')
+        GROUP BY 1
+        ORDER BY 1
+    """)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def slowest_files(days: int, limit: int) -> pd.DataFrame:
+    """
+    The files that took longest to process.
+    """
+    return run_query(f"""
+        SELECT FILENAME, STARTED_AT, SECONDS, "ROWS", BYTES / 1e6 AS MB, RUN_ID
+        FROM {METRICS_TABLE}
+        WHERE {_window(days)} AND PHASE = 'file'
+        ORDER BY SECONDS DESC
+        LIMIT {int(limit)}
+    """)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def slowest_tables(days: int, limit: int) -> pd.DataFrame:
+    """
+    The Access tables that took longest to extract and load.
+    """
+    return run_query(f"""
+        SELECT FILENAME, TABLE_NAME,
+               SUM(IFF(PHASE = 'extract', SECONDS, 0)) AS EXTRACT_SECONDS,
+               SUM(IFF(PHASE = 'load', SECONDS, 0)) AS LOAD_SECONDS,
+               EXTRACT_SECONDS + LOAD_SECONDS AS TOTAL_SECONDS,
+               MAX("ROWS") AS TABLE_ROWS,
+               MIN(STARTED_AT) AS TABLE_STARTED_AT
+        FROM {METRICS_TABLE}
+        WHERE {_window(days)} AND PHASE IN ('extract', 'load') AND TABLE_NAME IS NOT NULL
+        GROUP BY RUN_ID, FILENAME, TABLE_NAME
+        ORDER BY TOTAL_SECONDS DESC
+        LIMIT {int(limit)}
+    """)
+
+
+@st.cache_data(ttl=60)
+def raw_queue_depth() -> pd.DataFrame:
+    """
+    Number and size of the files waiting on the raw stage.
+    """
+    try:
+        SESSION.sql(f"LIST @{RAW_STAGE}").collect()
+        return SESSION.sql("""
+            SELECT COUNT(*) AS FILES, COALESCE(SUM("size"), 0) / 1e6 AS MB
+            FROM TABLE(RESULT_SCAN(LAST_QUERY_ID()))
+        """).to_pandas()
+    except Exception as e:
+        st.error(f"Error listing stage @{RAW_STAGE}: {e}")
+        return pd.DataFrame()
+
 
 def main():
     """
     Usage Analytics
     """
     st.header("Usage Analytics Tool")
-    
-    
+    st.caption(f"Ingestion metrics from {METRICS_TABLE}, refreshed every {CACHE_TTL // 60} minutes")
+    col_days, col_limit, col_refresh = st.columns([2, 2, 1])
+    days = col_days.selectbox("Lookback (days)", LOOKBACK_DAYS, index=1)
+    limit = col_limit.number_input("Slowest files/tables", min_value=5, max_value=100, value=20)
+    if col_refresh.button("Refresh"):
+        st.cache_data.clear()
+
+    queue = raw_queue_depth()
+    runs = run_throughput(days)
+    col1, col2, col3, col4 = st.columns(4)
+    if len(queue) > 0:
+        col1.metric(f"Queued on @{RAW_STAGE}", int(queue["FILES"][0]), f"{queue['MB'][0]:.1f} MB", delta_color="off")
+    if len(runs) > 0:
+        files, errors = runs["FILES"].sum(), runs["ERRORS"].sum()
+        col2.metric("Files processed", int(files))
+        col3.metric("Error rate", f"{errors / files:.1%}" if files else "-")
+        col4.metric("Rows per second (last run)", f"{runs['ROWS_PER_SECOND'].fillna(0).iloc[-1]:,.0f}")
+    else:
+        st.info(f"No runs recorded in {METRICS_TABLE} in the last {days} days.")
+        return
+
+    with st.expander("Throughput", expanded=True):
+        hourly = files_per_hour(days)
+        st.caption("Files per hour")
+        st.bar_chart(hourly, x="HOUR", y=["FILES", "ERRORS"])
+        st.caption("Rows per second of every run")
+        st.line_chart(runs, x="RUN_STARTED_AT", y="ROWS_PER_SECOND")
+        st.dataframe(runs, hide_index=True)
+
+    with st.expander("Pipeline phases", expanded=True):
+        phases = phase_times(days)
+        st.caption("Time per phase.  Phases overlap: 'file' covers the others and uploads run during extraction.")
+        st.bar_chart(phases, x="PHASE", y="TOTAL_SECONDS")
+        st.dataframe(phases, hide_index=True)
+
+    with st.expander("Errors"):
+        st.line_chart(error_rate(days), x="DAY", y="ERROR_RATE")
+
+    with st.expander("Slowest files and tables"):
+        st.caption("Files")
+        st.dataframe(slowest_files(days, limit), hide_index=True)
+        st.caption("Tables")
+        st.dataframe(slowest_tables(days, limit), hide_index=True)
+
+
 if __name__ == "__main__":
     main()